@@ -11,7 +11,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from app.database import Base
-from app.models import User, Character, Conversation, Message
+from app.models import User, Character, Conversation, Message, Job, IdempotencyKey
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,40 @@
+"""add_conversation_summary_columns
+
+Revision ID: 5d2e8a41c7b9
+Revises: 0c33def2c20e
+Create Date: 2026-10-17 09:12:44.381207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2e8a41c7b9'
+down_revision: Union[str, None] = '0c33def2c20e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Running summary of turns that fell out of the verbatim context window
+    from sqlalchemy import inspect
+    
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    
+    conversations_columns = [col['name'] for col in inspector.get_columns('conversations')]
+    
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        if 'summary' not in conversations_columns:
+            batch_op.add_column(sa.Column('summary', sa.Text(), nullable=True))
+        if 'summary_turn' not in conversations_columns:
+            batch_op.add_column(sa.Column('summary_turn', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.drop_column('summary_turn')
+        batch_op.drop_column('summary')
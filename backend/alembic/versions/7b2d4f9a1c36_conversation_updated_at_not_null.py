@@ -0,0 +1,44 @@
+"""conversation_updated_at_not_null
+
+Revision ID: 7b2d4f9a1c36
+Revises: e3a9d51f7c08
+Create Date: 2026-10-17 18:40:12.905716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b2d4f9a1c36'
+down_revision: Union[str, None] = 'e3a9d51f7c08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The conversation list pages through (updated_at, id) on the raw column,
+    # so every row needs a value
+    op.execute("""
+        UPDATE conversations SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)
+        WHERE updated_at IS NULL
+    """)
+
+    if op.get_bind().dialect.name == 'sqlite':
+        # SQLite keeps datetimes as text: CURRENT_TIMESTAMP wrote them without
+        # microseconds, SQLAlchemy writes them with, and the two only compare
+        # correctly once they share one format
+        op.execute("""
+            UPDATE conversations SET updated_at = updated_at || '.000000'
+            WHERE length(updated_at) = 19
+        """)
+
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.alter_column('updated_at', existing_type=sa.DateTime(timezone=True), nullable=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.alter_column('updated_at', existing_type=sa.DateTime(timezone=True), nullable=True)
@@ -0,0 +1,98 @@
+"""unique_message_turns
+
+Revision ID: 9c1e7a3f52d4
+Revises: f176d9bbb0ee
+Create Date: 2026-10-17 14:22:05.310447
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c1e7a3f52d4'
+down_revision: Union[str, None] = 'f176d9bbb0ee'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+OLD_INDEX = 'ix_messages_conversation_id_turn_number'
+UNIQUE_INDEX = 'uq_messages_conversation_id_turn_number'
+
+# Conversations where concurrent writers stored two messages with the same turn
+DUPLICATED = """
+    SELECT conversation_id FROM messages
+    GROUP BY conversation_id, turn_number HAVING COUNT(*) > 1
+"""
+
+
+def _existing_indexes(bind):
+    from sqlalchemy import inspect
+    return {index['name'] for index in inspect(bind).get_indexes('messages')}
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    # Renumber affected conversations 1..n in (turn_number, id) order. Their
+    # running summaries refer to the old numbering, so they are rebuilt.
+    op.execute(f"""
+        UPDATE conversations SET summary = NULL, summary_turn = 0
+        WHERE id IN ({DUPLICATED})
+    """)
+    op.execute(f"""
+        UPDATE messages SET turn_number = (
+            SELECT numbered.turn FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY conversation_id ORDER BY turn_number, id
+                ) AS turn
+                FROM messages
+            ) AS numbered
+            WHERE numbered.id = messages.id
+        )
+        WHERE conversation_id IN ({DUPLICATED})
+    """)
+
+    # Turns are now allocated from current_turn, which must cover every stored turn
+    op.execute("""
+        UPDATE conversations SET current_turn = (
+            SELECT MAX(turn_number) FROM messages WHERE messages.conversation_id = conversations.id
+        )
+        WHERE current_turn < (
+            SELECT MAX(turn_number) FROM messages WHERE messages.conversation_id = conversations.id
+        )
+    """)
+
+    existing = _existing_indexes(bind)
+    if bind.dialect.name == 'postgresql':
+        # Build the unique index without blocking writes, then drop the plain one it replaces
+        with op.get_context().autocommit_block():
+            if UNIQUE_INDEX not in existing:
+                op.create_index(UNIQUE_INDEX, 'messages', ['conversation_id', 'turn_number'],
+                                unique=True, postgresql_concurrently=True)
+            if OLD_INDEX in existing:
+                op.drop_index(OLD_INDEX, table_name='messages', postgresql_concurrently=True)
+    else:
+        if UNIQUE_INDEX not in existing:
+            op.create_index(UNIQUE_INDEX, 'messages', ['conversation_id', 'turn_number'], unique=True)
+        if OLD_INDEX in existing:
+            op.drop_index(OLD_INDEX, table_name='messages')
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    existing = _existing_indexes(bind)
+
+    if bind.dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            if OLD_INDEX not in existing:
+                op.create_index(OLD_INDEX, 'messages', ['conversation_id', 'turn_number'],
+                                postgresql_concurrently=True)
+            if UNIQUE_INDEX in existing:
+                op.drop_index(UNIQUE_INDEX, table_name='messages', postgresql_concurrently=True)
+    else:
+        if OLD_INDEX not in existing:
+            op.create_index(OLD_INDEX, 'messages', ['conversation_id', 'turn_number'])
+        if UNIQUE_INDEX in existing:
+            op.drop_index(UNIQUE_INDEX, table_name='messages')
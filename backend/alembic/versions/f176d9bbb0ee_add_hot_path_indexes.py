@@ -0,0 +1,67 @@
+"""add_hot_path_indexes
+
+Revision ID: f176d9bbb0ee
+Revises: 5d2e8a41c7b9
+Create Date: 2026-10-17 11:03:27.518934
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f176d9bbb0ee'
+down_revision: Union[str, None] = '5d2e8a41c7b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (index name, table, columns)
+INDEXES = [
+    ('ix_messages_conversation_id_turn_number', 'messages', ['conversation_id', 'turn_number']),
+    ('ix_conversations_user_id_updated_at', 'conversations', ['user_id', 'updated_at']),
+    ('ix_characters_created_by_id', 'characters', ['created_by_id']),
+    ('ix_characters_is_public', 'characters', ['is_public']),
+]
+
+
+def _existing_indexes(bind, table):
+    from sqlalchemy import inspect
+    return {index['name'] for index in inspect(bind).get_indexes(table)}
+
+
+def upgrade() -> None:
+    # Indexes for the hot read paths: conversation history by turn, a user's
+    # conversation list, and the character catalog filter
+    bind = op.get_bind()
+    missing = [
+        (name, table, columns) for name, table, columns in INDEXES
+        if name not in _existing_indexes(bind, table)
+    ]
+
+    if bind.dialect.name == 'postgresql':
+        # CREATE INDEX CONCURRENTLY does not block writes while the index
+        # builds, but cannot run inside a transaction
+        with op.get_context().autocommit_block():
+            for name, table, columns in missing:
+                op.create_index(name, table, columns, postgresql_concurrently=True)
+    else:
+        for name, table, columns in missing:
+            op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    present = [
+        (name, table) for name, table, _ in INDEXES
+        if name in _existing_indexes(bind, table)
+    ]
+
+    if bind.dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name, table in present:
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
+    else:
+        for name, table in present:
+            op.drop_index(name, table_name=table)
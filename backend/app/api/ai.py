@@ -1,13 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, Field
+from typing import List, Optional, Tuple
+import asyncio
+import json
+import math
 
-from ..database import get_db
+from ..database import get_db, release_connection
 from ..models.conversation import Conversation
-from ..models.message import Message
 from ..models.character import Character
-from ..services.ai_service import generate_character_response, generate_conversation_title
+from ..models.user import User
+from ..auth import get_optional_current_user
+from ..services.ai_service import generate_character_response, generate_conversation_title, stream_character_response
+from ..services.conversation_service import (
+    DEFAULT_USER_PROMPT, load_context, save_character_message, save_character_messages, message_payload, title_excerpt
+)
+from ..services.llm import (
+    get_provider, available_providers, llm_router, llm_scheduler,
+    ProviderUnavailableError, SchedulerOverloadedError
+)
+from ..services.autonomous_runner import run_conversation, is_running
+from ..services.events import publish_event, TITLE_CHANGED
+from ..services.idempotency import run_idempotent
+from ..services.tracing import tracer
 from ..config import settings
 
 router = APIRouter()
@@ -20,99 +38,287 @@ class GenerateResponseResponse(BaseModel):
     message: dict
     should_continue: bool
 
+class GenerateRoundRequest(BaseModel):
+    character_ids: Optional[List[int]] = None
+    user_prompt: str = None
+
+class GenerateRoundResponse(BaseModel):
+    messages: List[dict]
+    should_continue: bool
+    failed_character_ids: List[int] = []
+
+class RunConversationRequest(BaseModel):
+    max_turns: int = Field(default=5, ge=1, le=50)
+    user_prompt: Optional[str] = None
+    stop_when_done: bool = True
+
+async def _load_turn_context(db: AsyncSession, conversation_id: int, character_id: int) -> Tuple[Conversation, Character]:
+    conversation = await db.get(Conversation, conversation_id)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    character = await db.get(Character, character_id)
+    if not character:
+        raise HTTPException(status_code=404, detail="Character not found")
+    
+    return conversation, character
+
+def _sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _error_event(e: Exception, context: str) -> str:
+    if isinstance(e, ProviderUnavailableError):
+        return _sse("error", {"detail": str(e), "status": 503, "retry_after": math.ceil(e.retry_after)})
+    if isinstance(e, SchedulerOverloadedError):
+        return _sse("error", {"detail": str(e), "status": 429, "retry_after": e.retry_after})
+    print(f"Error in {context}: {str(e)}")
+    return _sse("error", {"detail": f"Internal server error: {str(e)}"})
+
+def _provider_unavailable(e: ProviderUnavailableError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+    )
+
+def _overloaded(e: SchedulerOverloadedError) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
 @router.post("/conversations/{conversation_id}/generate-response", response_model=GenerateResponseResponse)
 async def generate_response(
     conversation_id: int,
     request: GenerateResponseRequest,
-    db: Session = Depends(get_db)
+    http_request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[User] = Depends(get_optional_current_user)
 ):
+    """
+    Generate and save the next turn for `character_id`.
+    
+    Send an Idempotency-Key header to make retries safe: a repeat returns the
+    first response instead of paying for another generation.
+    """
+    async def generate():
+        try:
+            with tracer.start_as_current_span("load_context"):
+                conversation, character = await _load_turn_context(db, conversation_id, request.character_id)
+                context, _ = await load_context(db, conversation)
+                # No connection is held while the provider works
+                await release_connection(db)
+            
+            # Generate AI response
+            ai_response = await generate_character_response(
+                character.name,
+                character.personality,
+                context,
+                request.user_prompt or DEFAULT_USER_PROMPT,
+                user_key=conversation.user_id
+            )
+            
+            with tracer.start_as_current_span("save_message"):
+                message = await save_character_message(db, conversation, character.id, ai_response.content, character.name)
+            
+            with tracer.start_as_current_span("serialize"):
+                return GenerateResponseResponse(
+                    message=message_payload(message),
+                    should_continue=ai_response.should_continue
+                )
+        except HTTPException:
+            raise
+        except ProviderUnavailableError as e:
+            raise _provider_unavailable(e)
+        except SchedulerOverloadedError as e:
+            raise _overloaded(e)
+        except Exception as e:
+            print(f"Error in generate_response: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    
+    with tracer.start_as_current_span("generate_response") as span:
+        span.set_attribute("conversation.id", conversation_id)
+        span.set_attribute("character.id", request.character_id)
+        return await run_idempotent(http_request, request, generate, current_user.id if current_user else None)
+
+@router.post("/conversations/{conversation_id}/generate-response/stream")
+async def generate_response_stream(
+    conversation_id: int,
+    request: GenerateResponseRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Streaming variant of generate-response (Server-Sent Events):
+    - `token` events carry content deltas as they arrive from the provider
+    - a final `message` event carries the persisted message and should_continue
+    - an `error` event is sent instead if generation fails midway
+    
+    Overload is reported as a plain 429 before the stream starts.
+    """
+    conversation, character = await _load_turn_context(db, conversation_id, request.character_id)
+    context, _ = await load_context(db, conversation)
+    await release_connection(db)
+    
     try:
-        # Get conversation
-        conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
-        if not conversation:
-            raise HTTPException(status_code=404, detail="Conversation not found")
-        
-        # Get character
-        character = db.query(Character).filter(Character.id == request.character_id).first()
-        if not character:
-            raise HTTPException(status_code=404, detail="Character not found")
-        
-        # Build conversation history
-        messages = db.query(Message).filter(Message.conversation_id == conversation_id).all()
-        conversation_history = []
-        
-        for msg in messages:
-            if msg.is_user_prompt:
-                conversation_history.append(f"User: {msg.content}")
-            elif msg.character:
-                conversation_history.append(f"{msg.character.name}: {msg.content}")
-        
-        conversation_history_str = "\n".join(conversation_history)
-        if not conversation_history_str:
-            conversation_history_str = "This is the beginning of the conversation."
-        
-        # Generate AI response
-        ai_response = await generate_character_response(
+        stream = await stream_character_response(
             character.name,
             character.personality,
-            conversation_history_str,
-            request.user_prompt or "Please introduce yourself and share your thoughts on education."
+            context,
+            request.user_prompt or DEFAULT_USER_PROMPT,
+            user_key=conversation.user_id
         )
-        
-        # Save the response as a message
-        next_turn = max([m.turn_number for m in messages] + [0]) + 1
-        message = Message(
-            conversation_id=conversation_id,
-            character_id=request.character_id,
-            content=ai_response.content,
-            is_user_prompt=False,
-            turn_number=next_turn
-        )
-        
-        db.add(message)
-        
-        # Update conversation's current turn
-        conversation.current_turn = next_turn
-        
-        db.commit()
-        db.refresh(message)
-        
-        return GenerateResponseResponse(
-            message={
-                "id": message.id,
-                "content": message.content,
-                "character_id": message.character_id,
-                "turn_number": message.turn_number,
-                "created_at": message.created_at.isoformat() if message.created_at else None
-            },
-            should_continue=ai_response.should_continue
-        )
-    except Exception as e:
-        print(f"Error in generate_response: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    except SchedulerOverloadedError as e:
+        raise _overloaded(e)
+    
+    async def event_stream():
+        try:
+            async for delta in stream:
+                yield _sse("token", {"content": delta})
+            
+            message = await save_character_message(db, conversation, character.id, stream.result.content, character.name)
+            yield _sse("message", {
+                "message": message_payload(message),
+                "should_continue": stream.result.should_continue
+            })
+        except Exception as e:
+            yield _error_event(e, "generate_response_stream")
+    
+    # Releases the scheduler slot even if the client disconnects before streaming starts
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+        background=BackgroundTask(stream.close)
+    )
+
+@router.post("/conversations/{conversation_id}/generate-round", response_model=GenerateRoundResponse)
+async def generate_round(
+    conversation_id: int,
+    request: GenerateRoundRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Let every participant (or the chosen `character_ids`) respond at once.
+    
+    All replies are generated concurrently (at most AI_MAX_CONCURRENT_PER_USER
+    at a time, all counted against the user) against the same history snapshot,
+    then saved together with consecutive turn numbers in participant order.
+    Characters whose generation failed are skipped and listed in
+    failed_character_ids; the round only fails if every generation does.
+    """
+    conversation = await db.get(Conversation, conversation_id)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    speaker_ids = request.character_ids or conversation.participant_ids or []
+    unknown = [cid for cid in speaker_ids if cid not in (conversation.participant_ids or [])]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Characters {unknown} are not participants in this conversation")
+    characters = {c.id: c for c in (await db.scalars(select(Character).where(Character.id.in_(speaker_ids)))).all()}
+    speakers = [characters[cid] for cid in dict.fromkeys(speaker_ids) if cid in characters]
+    if not speakers:
+        raise HTTPException(status_code=400, detail="No participants to respond")
+    
+    context, _ = await load_context(db, conversation)
+    await release_connection(db)
+    user_prompt = request.user_prompt or DEFAULT_USER_PROMPT
+    
+    # The round holds as many of the user's concurrency slots as it runs
+    # generations at once, reserved together so it either fits or gets a 429
+    width = min(len(speakers), settings.AI_MAX_CONCURRENT_PER_USER)
+    limit = asyncio.Semaphore(width)
+    
+    async def respond(character: Character):
+        async with limit:
+            return await generate_character_response(character.name, character.personality, context, user_prompt)
+    
+    try:
+        with llm_scheduler.user_reservation(conversation.user_id, width):
+            results = await asyncio.gather(*[respond(character) for character in speakers], return_exceptions=True)
+    except SchedulerOverloadedError as e:
+        raise _overloaded(e)
+    
+    replies = [(character, result) for character, result in zip(speakers, results) if not isinstance(result, Exception)]
+    failures = [result for result in results if isinstance(result, Exception)]
+    if not replies:
+        error = failures[0]
+        if isinstance(error, ProviderUnavailableError):
+            raise _provider_unavailable(error)
+        if isinstance(error, SchedulerOverloadedError):
+            raise _overloaded(error)
+        print(f"Error in generate_round: {str(error)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(error)}")
+    for error in failures:
+        print(f"Error in generate_round: {str(error)}")
+    
+    messages = await save_character_messages(
+        db,
+        conversation,
+        [(character.id, response.content, character.name) for character, response in replies]
+    )
+    return GenerateRoundResponse(
+        messages=[message_payload(message) for message in messages],
+        should_continue=any(response.should_continue for _, response in replies),
+        failed_character_ids=[c.id for c, result in zip(speakers, results) if isinstance(result, Exception)]
+    )
+
+@router.post("/conversations/{conversation_id}/run")
+async def run_autonomous_conversation(
+    conversation_id: int,
+    request: RunConversationRequest,
+    http_request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Run several character turns server-side and stream them (Server-Sent Events):
+    - `turn` announces the next speaker and turn number
+    - `token` events carry content deltas for the current speaker
+    - `message` carries each persisted message and its should_continue flag
+    - `done` reports how many turns ran and why the run stopped
+    
+    Setting is_autonomous to false on the conversation stops the run after the current turn.
+    """
+    conversation = await db.get(Conversation, conversation_id)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    if is_running(conversation_id):
+        raise HTTPException(status_code=409, detail="Conversation is already running")
+    
+    async def event_stream():
+        try:
+            async for event in run_conversation(
+                db,
+                conversation,
+                max_turns=request.max_turns,
+                user_prompt=request.user_prompt,
+                stop_when_done=request.stop_when_done,
+                is_disconnected=http_request.is_disconnected
+            ):
+                yield _sse(event.event, event.data)
+        except Exception as e:
+            yield _error_event(e, "run_autonomous_conversation")
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
 
 @router.post("/conversations/{conversation_id}/generate-title")
-async def generate_title(conversation_id: int, db: Session = Depends(get_db)):
-    conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+async def generate_title(conversation_id: int, db: AsyncSession = Depends(get_db)):
+    conversation = await db.get(Conversation, conversation_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    messages = db.query(Message).filter(Message.conversation_id == conversation_id).limit(3).all()
-    if not messages:
+    first_messages_str = await title_excerpt(db, conversation_id)
+    if first_messages_str is None:
         raise HTTPException(status_code=404, detail="Conversation not found or empty")
+    await release_connection(db)
     
-    first_messages = []
-    for msg in messages:
-        if msg.character:
-            first_messages.append(f"{msg.character.name}: {msg.content}")
-        else:
-            first_messages.append(f"User: {msg.content}")
-    
-    first_messages_str = "\n".join(first_messages)
-    title = await generate_conversation_title(first_messages_str)
+    try:
+        title = await generate_conversation_title(first_messages_str, user_key=conversation.user_id)
+    except SchedulerOverloadedError as e:
+        raise _overloaded(e)
     
     conversation.title = title
-    db.commit()
+    await db.commit()
+    await publish_event(conversation_id, TITLE_CHANGED, {"title": title})
     
     return {"title": title}
 
@@ -121,14 +327,20 @@ async def get_ai_config():
     return {
         "ai_provider": settings.AI_PROVIDER,
         "openai_configured": bool(settings.OPENAI_API_KEY and settings.OPENAI_API_KEY != "sk-fake-key-for-development"),
-        "anthropic_configured": bool(settings.ANTHROPIC_API_KEY and settings.ANTHROPIC_API_KEY != "sk-ant-REDACTED")
+        "anthropic_configured": bool(settings.ANTHROPIC_API_KEY and settings.ANTHROPIC_API_KEY != "sk-ant-REDACTED"),
+        "providers": {name: get_provider(name).is_configured() for name in available_providers()},
+        "fallback_providers": settings.AI_FALLBACK_PROVIDERS,
+        "provider_health": llm_router.snapshot(),
+        "scheduler": llm_scheduler.snapshot()
     }
 
 class AIProviderRequest(BaseModel):
-    provider: Literal["openai", "anthropic"]
+    provider: str
 
 @router.post("/config/provider")
 async def set_ai_provider(request: AIProviderRequest):
+    if request.provider not in available_providers():
+        raise HTTPException(status_code=400, detail=f"Unknown AI provider '{request.provider}'")
     # Note: This changes the runtime setting but doesn't persist to .env
     settings.AI_PROVIDER = request.provider
     return {"ai_provider": settings.AI_PROVIDER, "message": f"AI provider set to {request.provider}"}
\ No newline at end of file
@@ -1,5 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from typing import List
 
 from ..database import get_db
@@ -7,12 +9,24 @@ from ..models.character import Character
 from ..models.user import User
 from ..schemas.character import CharacterCreate, CharacterUpdate, CharacterResponse
 from ..auth import get_current_user, get_optional_current_user
+from ..services.transcript_cache import transcript_cache
+from ..services.character_catalog import character_catalog
 
 router = APIRouter()
 
+async def _load_character(db: AsyncSession, character_id: int) -> Character:
+    """Load a character with its creator, as CharacterResponse serializes it"""
+    return await db.scalar(
+        select(Character)
+        .options(joinedload(Character.created_by))
+        .where(Character.id == character_id)
+        .execution_options(populate_existing=True)
+    )
+
 @router.get("/", response_model=List[CharacterResponse])
 async def get_characters(
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_optional_current_user)
 ):
     """
@@ -20,32 +34,29 @@ async def get_characters(
     - Built-in characters (created_by_id is NULL)
     - Public user-created characters (is_public is True)
     - Current user's private characters (created_by_id equals current user)
+    
+    Served pre-serialized from the catalog cache with an ETag; a matching
+    If-None-Match gets a 304.
     """
-    if current_user:
-        characters = db.query(Character).options(joinedload(Character.created_by)).filter(
-            (Character.created_by_id == None) |  # Built-in characters
-            (Character.is_public == True) |      # Public characters
-            (Character.created_by_id == current_user.id)  # User's own characters
-        ).all()
-    else:
-        # Unauthenticated users only see built-in and public characters
-        characters = db.query(Character).options(joinedload(Character.created_by)).filter(
-            (Character.created_by_id == None) |  # Built-in characters
-            (Character.is_public == True)        # Public characters
-        ).all()
-    return characters
+    # Unauthenticated users only see built-in and public characters
+    body, etag = await character_catalog.get(db, current_user.id if current_user else None)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+    if etag in [tag.strip().removeprefix("W/") for tag in request.headers.get("If-None-Match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @router.get("/active", response_model=List[CharacterResponse])
 async def get_active_characters(
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_optional_current_user)
 ):
     # Alias for get_characters since we removed is_active column
-    return await get_characters(db, current_user)
+    return await get_characters(request, db, current_user)
 
 @router.get("/{character_id}", response_model=CharacterResponse)
-async def get_character(character_id: int, db: Session = Depends(get_db)):
-    character = db.query(Character).filter(Character.id == character_id).first()
+async def get_character(character_id: int, db: AsyncSession = Depends(get_db)):
+    character = await _load_character(db, character_id)
     if not character:
         raise HTTPException(status_code=404, detail="Character not found")
     return character
@@ -53,7 +64,7 @@ async def get_character(character_id: int, db: Session = Depends(get_db)):
 @router.post("/", response_model=CharacterResponse)
 async def create_character(
     character: CharacterCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     # Create character linked to current user
@@ -67,18 +78,18 @@ async def create_character(
         created_by_id=current_user.id
     )
     db.add(db_character)
-    db.commit()
-    db.refresh(db_character)
-    return db_character
+    await db.commit()
+    character_catalog.invalidate(current_user.id)
+    return await _load_character(db, db_character.id)
 
 @router.put("/{character_id}", response_model=CharacterResponse)
 async def update_character(
     character_id: int, 
     character_update: CharacterUpdate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    character = db.query(Character).filter(Character.id == character_id).first()
+    character = await _load_character(db, character_id)
     if not character:
         raise HTTPException(status_code=404, detail="Character not found")
     
@@ -90,17 +101,20 @@ async def update_character(
     for key, value in update_data.items():
         setattr(character, key, value)
     
-    db.commit()
-    db.refresh(character)
-    return character
+    await db.commit()
+    character_catalog.invalidate(current_user.id)
+    if "name" in update_data:
+        # Cached transcripts render speaker names
+        transcript_cache.clear()
+    return await _load_character(db, character_id)
 
 @router.delete("/{character_id}")
 async def delete_character(
     character_id: int, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    character = db.query(Character).filter(Character.id == character_id).first()
+    character = await _load_character(db, character_id)
     if not character:
         raise HTTPException(status_code=404, detail="Character not found")
     
@@ -108,6 +122,8 @@ async def delete_character(
     if character.created_by_id != current_user.id:
         raise HTTPException(status_code=403, detail="You can only delete characters you created")
     
-    db.delete(character)
-    db.commit()
+    await db.delete(character)
+    await db.commit()
+    character_catalog.invalidate(current_user.id)
+    transcript_cache.clear()
     return {"success": True}
\ No newline at end of file
@@ -1,56 +1,189 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect, status
+from sqlalchemy import and_, delete, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from typing import List, Optional, Tuple
+from datetime import datetime
+import asyncio
+import base64
 
-from ..database import get_db
+from ..database import get_db, AsyncSessionLocal
 from ..models.conversation import Conversation
 from ..models.message import Message
 from ..models.character import Character
-from ..schemas.conversation import ConversationCreate, ConversationUpdate, ConversationResponse, ConversationWithMessages
-from ..schemas.message import MessageCreate, MessageResponse
+from ..models.job import Job
+from ..schemas.conversation import (
+    ConversationCreate, ConversationUpdate, ConversationResponse, ConversationWithMessages, ConversationChanges
+)
+from ..schemas.message import MessageCreate, MessageResponse, ConversationMessageResponse
 from ..models.user import User
-from ..auth import get_current_user
+from ..auth import get_current_user, get_optional_current_user, authenticate_token
+from ..services.conversation_service import allocate_turns, record_message, publish_messages
+from ..services.transcript_cache import transcript_cache
+from ..services.idempotency import run_idempotent
+from ..services.events import publish_event, subscribe_events, READY, TITLE_CHANGED, TURN_ADVANCED
 
 router = APIRouter()
 
+# Messages are serialized with their character and its creator; load them
+# eagerly, lazy loads are not available under asyncio
+_message_character = selectinload(Message.character).selectinload(Character.created_by)
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def _encode_cursor(conversation: Conversation) -> str:
+    """Opaque keyset cursor for the conversation list: (updated_at, id) of the last row"""
+    raw = f"{conversation.updated_at.isoformat()}|{conversation.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        updated_at, conversation_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return datetime.fromisoformat(updated_at), int(conversation_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.get("/", response_model=List[ConversationResponse])
 async def get_conversations(
-    db: Session = Depends(get_db),
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    """
+    The user's conversations, most recently updated first, `limit` at a time.
+    
+    When more remain, the X-Next-Cursor response header holds the cursor for
+    the next page; pass it back as `cursor`.
+    """
     # Only return conversations for the current user
-    conversations = db.query(Conversation).filter(Conversation.user_id == current_user.id).all()
+    query = select(Conversation).where(Conversation.user_id == current_user.id)
+    if cursor:
+        updated_at, conversation_id = _decode_cursor(cursor)
+        query = query.where(or_(
+            Conversation.updated_at < updated_at,
+            and_(Conversation.updated_at == updated_at, Conversation.id < conversation_id)
+        ))
+    # Served by ix_conversations_user_id_updated_at
+    conversations = (await db.scalars(
+        query.order_by(Conversation.updated_at.desc(), Conversation.id.desc()).limit(limit + 1)
+    )).all()
+    
+    if len(conversations) > limit:
+        conversations = conversations[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = _encode_cursor(conversations[-1])
     return conversations
 
+async def _user_conversation(db: AsyncSession, conversation_id: int, user: User) -> Conversation:
+    conversation = await db.scalar(select(Conversation).where(
+        Conversation.id == conversation_id,
+        Conversation.user_id == user.id
+    ))
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return conversation
+
+def _message_rows(conversation_id: int):
+    """Plain rows: messages reference their speaker by character_id"""
+    return select(
+        Message.id,
+        Message.conversation_id,
+        Message.character_id,
+        Message.content,
+        Message.is_user_prompt,
+        Message.turn_number,
+        Message.created_at
+    ).where(Message.conversation_id == conversation_id)
+
+async def _conversation_characters(db: AsyncSession, conversation: Conversation, messages) -> dict:
+    """Participants and any earlier speakers among `messages`, with their creators, in one query"""
+    participant_ids = set(conversation.participant_ids or [])
+    speaker_ids = {m.character_id for m in messages if m.character_id is not None}
+    characters = (await db.scalars(
+        select(Character)
+        .options(joinedload(Character.created_by))
+        .where(Character.id.in_(participant_ids | speaker_ids))
+        .order_by(Character.id)
+    )).all()
+    return {
+        "participants": [c for c in characters if c.id in participant_ids],
+        "former_participants": [c for c in characters if c.id not in participant_ids]
+    }
+
 @router.get("/{conversation_id}", response_model=ConversationWithMessages)
 async def get_conversation(
     conversation_id: int, 
-    db: Session = Depends(get_db),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    before_turn: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.user_id == current_user.id
-    ).first()
-    if not conversation:
-        raise HTTPException(status_code=404, detail="Conversation not found")
+    """
+    A conversation with its messages and participants.
+    
+    Without `limit` the whole history is returned. With it, only the newest
+    `limit` messages before `before_turn` are, still in turn order; when older
+    ones remain, `next_cursor` is the `before_turn` for the next page.
+    """
+    conversation = await _user_conversation(db, conversation_id, current_user)
     
-    # Get messages with character info
-    messages = db.query(Message).filter(Message.conversation_id == conversation_id).all()
+    query = _message_rows(conversation_id)
+    if before_turn is not None:
+        query = query.where(Message.turn_number < before_turn)
     
-    # Get participants
-    participants = db.query(Character).filter(Character.id.in_(conversation.participant_ids)).all()
+    next_cursor = None
+    if limit is None:
+        messages = (await db.execute(query.order_by(Message.turn_number, Message.id))).all()
+    else:
+        # Newest first from the (conversation_id, turn_number) index, then back to turn order
+        messages = (await db.execute(
+            query.order_by(Message.turn_number.desc(), Message.id.desc()).limit(limit + 1)
+        )).all()
+        if len(messages) > limit:
+            messages = messages[:limit]
+            next_cursor = messages[-1].turn_number
+        messages.reverse()
     
     return ConversationWithMessages(
-        **conversation.__dict__,
-        messages=messages,
-        participants=participants
+        **ConversationResponse.model_validate(conversation).model_dump(),
+        messages=[ConversationMessageResponse.model_validate(m) for m in messages],
+        **await _conversation_characters(db, conversation, messages),
+        next_cursor=next_cursor
+    )
+
+@router.get("/{conversation_id}/changes", response_model=ConversationChanges)
+async def get_conversation_changes(
+    conversation_id: int,
+    since_turn: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Delta sync: messages after turn `since_turn` plus the conversation's
+    current fields and participants, so a client that already holds the
+    history only downloads what is new. Pass `last_turn` back as
+    `since_turn` on the next call.
+    """
+    conversation = await _user_conversation(db, conversation_id, current_user)
+    
+    messages = (await db.execute(
+        _message_rows(conversation_id)
+        .where(Message.turn_number > since_turn)
+        .order_by(Message.turn_number, Message.id)
+    )).all()
+    
+    return ConversationChanges(
+        **ConversationResponse.model_validate(conversation).model_dump(),
+        messages=[ConversationMessageResponse.model_validate(m) for m in messages],
+        **await _conversation_characters(db, conversation, messages),
+        last_turn=max([since_turn] + [m.turn_number for m in messages])
     )
 
 @router.post("/", response_model=ConversationResponse)
 async def create_conversation(
     conversation: ConversationCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     # Create conversation linked to current user
@@ -60,49 +193,56 @@ async def create_conversation(
         user_id=current_user.id
     )
     db.add(db_conversation)
-    db.commit()
-    db.refresh(db_conversation)
+    await db.commit()
+    await db.refresh(db_conversation)
     return db_conversation
 
 @router.put("/{conversation_id}", response_model=ConversationResponse)
 async def update_conversation(
     conversation_id: int, 
     conversation_update: ConversationUpdate, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+    conversation = await db.get(Conversation, conversation_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     update_data = conversation_update.dict(exclude_unset=True)
+    previous_title, previous_turn = conversation.title, conversation.current_turn
     for key, value in update_data.items():
         setattr(conversation, key, value)
     
-    db.commit()
-    db.refresh(conversation)
+    await db.commit()
+    await db.refresh(conversation)
+    if conversation.title != previous_title:
+        await publish_event(conversation_id, TITLE_CHANGED, {"title": conversation.title})
+    if conversation.current_turn != previous_turn:
+        await publish_event(conversation_id, TURN_ADVANCED, {"current_turn": conversation.current_turn})
     return conversation
 
 @router.delete("/{conversation_id}")
 async def delete_conversation(
     conversation_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     # Only allow deletion of user's own conversations
-    conversation = db.query(Conversation).filter(
+    conversation = await db.scalar(select(Conversation).where(
         Conversation.id == conversation_id,
         Conversation.user_id == current_user.id
-    ).first()
+    ))
     
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    # Delete associated messages first (due to foreign key constraints)
-    db.query(Message).filter(Message.conversation_id == conversation_id).delete()
+    # Delete associated messages and jobs first (due to foreign key constraints)
+    await db.execute(delete(Message).where(Message.conversation_id == conversation_id))
+    await db.execute(delete(Job).where(Job.conversation_id == conversation_id))
     
     # Delete the conversation
-    db.delete(conversation)
-    db.commit()
+    await db.delete(conversation)
+    await db.commit()
+    transcript_cache.invalidate(conversation_id)
     
     return {"message": "Conversation deleted successfully"}
 
@@ -110,19 +250,90 @@ async def delete_conversation(
 async def create_message(
     conversation_id: int, 
     message: MessageCreate, 
-    db: Session = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[User] = Depends(get_optional_current_user)
 ):
-    # Verify conversation exists
-    conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
-    if not conversation:
-        raise HTTPException(status_code=404, detail="Conversation not found")
+    """Add a message; with an Idempotency-Key header, retries return the first message instead of adding another"""
+    async def create():
+        # Verify conversation exists
+        conversation = await db.get(Conversation, conversation_id)
+        if not conversation:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        
+        # Set conversation_id from URL; the turn is allocated here, a client-supplied one is ignored
+        message_data = message.dict(exclude={"turn_number"})
+        message_data["conversation_id"] = conversation_id
+        message_data["turn_number"] = await allocate_turns(db, conversation)
+        
+        db_message = Message(**message_data)
+        db.add(db_message)
+        await db.commit()
+        db_message = await db.scalar(
+            select(Message)
+            .options(_message_character)
+            .where(Message.id == db_message.id)
+            .execution_options(populate_existing=True)
+        )
+        record_message(db_message, db_message.character.name if db_message.character else None)
+        await publish_messages(conversation_id, [db_message])
+        await publish_event(conversation_id, TURN_ADVANCED, {"current_turn": db_message.turn_number})
+        return MessageResponse.model_validate(db_message)
+    
+    return await run_idempotent(
+        request, message.model_dump(exclude={"turn_number"}), create, current_user.id if current_user else None
+    )
+
+# Seconds a new conversation socket has to send its access token
+WS_AUTH_TIMEOUT = 10.0
+
+@router.websocket("/{conversation_id}/ws")
+async def conversation_events(websocket: WebSocket, conversation_id: int):
+    """
+    Live updates for one conversation: `message_created`, `turn_advanced` and
+    `title_changed` events as JSON `{"event": ..., "data": ...}` frames, sent
+    as they are committed. A `resync` event means updates were dropped for a
+    slow connection; fetch /changes to catch up.
     
-    # Set conversation_id from URL
-    message_data = message.dict()
-    message_data["conversation_id"] = conversation_id
+    Browsers cannot set headers on WebSockets, and query strings end up in
+    access logs, so the client sends its access token as the first frame,
+    `{"token": "..."}`, within WS_AUTH_TIMEOUT seconds; otherwise the socket
+    is closed with 1008. A `ready` event confirms the subscription.
+    """
+    await websocket.accept()
+    try:
+        frame = await asyncio.wait_for(websocket.receive_json(), timeout=WS_AUTH_TIMEOUT)
+        token = frame.get("token") if isinstance(frame, dict) else None
+        if not isinstance(token, str) or not token:
+            raise ValueError("Missing token")
+        # A short-lived session: the socket may stay open for hours
+        async with AsyncSessionLocal() as db:
+            user = await authenticate_token(token, db)
+            await _user_conversation(db, conversation_id, user)
+    except WebSocketDisconnect:
+        return
+    except (asyncio.TimeoutError, HTTPException, ValueError, KeyError):
+        # ValueError: not JSON; KeyError: a binary frame
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
     
-    db_message = Message(**message_data)
-    db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
-    return db_message
\ No newline at end of file
+    async with subscribe_events(conversation_id) as events:
+        await websocket.send_json({"event": READY, "data": {}})
+        
+        async def forward():
+            while True:
+                event = await events.get()
+                await websocket.send_json({"event": event.event, "data": event.data})
+        
+        async def drain():
+            # Clients send nothing after the token; this just notices the disconnect
+            while True:
+                await websocket.receive_text()
+        
+        tasks = [asyncio.create_task(forward()), asyncio.create_task(drain())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
\ No newline at end of file
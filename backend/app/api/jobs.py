@@ -0,0 +1,94 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+
+from ..config import settings
+from ..database import get_db, AsyncSessionLocal
+from ..models.character import Character
+from ..models.conversation import Conversation
+from ..models.job import Job
+from ..models.user import User
+from ..schemas.job import JobCreate, JobResponse
+from ..auth import get_current_user
+from ..services.jobs import enqueue_job, FINISHED
+from .ai import SSE_HEADERS, _sse
+
+router = APIRouter()
+
+async def _user_job(db: AsyncSession, job_id: int, user: User) -> Job:
+    job = await db.scalar(select(Job).where(Job.id == job_id, Job.user_id == user.id))
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/", response_model=JobResponse, status_code=202)
+async def create_job(
+    job: JobCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Queue a character response or title generation and return at once.
+    
+    Follow the job with GET /api/jobs/{id}, its /events stream, or the
+    conversation's WebSocket (`job_updated` events). Failed attempts are
+    retried with backoff; a finished job carries `result` or `error`.
+    """
+    conversation = await db.scalar(select(Conversation).where(
+        Conversation.id == job.conversation_id,
+        Conversation.user_id == current_user.id
+    ))
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    payload = {}
+    if job.kind == "generate_response":
+        if job.character_id is None:
+            raise HTTPException(status_code=400, detail="character_id is required for generate_response")
+        if not await db.get(Character, job.character_id):
+            raise HTTPException(status_code=404, detail="Character not found")
+        payload = {"character_id": job.character_id, "user_prompt": job.user_prompt}
+    
+    return await enqueue_job(db, job.kind, conversation.id, current_user.id, payload)
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    return await _user_job(db, job_id, current_user)
+
+@router.get("/{job_id}/events")
+async def stream_job(
+    job_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Server-Sent Events: a `job` event with the job's state whenever its
+    status or attempt count changes, ending once it has finished.
+    """
+    job = await _user_job(db, job_id, current_user)
+    
+    async def event_stream():
+        state = JobResponse.model_validate(job)
+        seen = None
+        # Polls the table, so it follows jobs run by workers in any process
+        async with AsyncSessionLocal() as poll_db:
+            while True:
+                if (state.status, state.attempts) != seen:
+                    seen = (state.status, state.attempts)
+                    yield _sse("job", state.model_dump(mode="json"))
+                if state.status in FINISHED or await request.is_disconnected():
+                    return
+                await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+                state = JobResponse.model_validate(await poll_db.scalar(
+                    select(Job).where(Job.id == job_id).execution_options(populate_existing=True)
+                ))
+                await poll_db.commit()
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
 from ..database import get_db
 from ..models.user import User
 from ..schemas.user import UserCreate, UserResponse, UserUpdate
-from ..auth import get_current_user
+from ..auth import get_current_user, supabase_auth
+from ..services.character_catalog import character_catalog
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
@@ -20,7 +22,7 @@ async def get_current_user_profile(
 async def update_current_user_profile(
     user_update: UserUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Update current authenticated user's profile"""
     
@@ -30,33 +32,37 @@ async def update_current_user_profile(
     if user_update.avatar_url is not None:
         current_user.avatar_url = user_update.avatar_url
     
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
+    supabase_auth.invalidate_user(current_user.supabase_id)
+    # The catalog shows creators' names
+    character_catalog.invalidate(current_user.id)
     
     return current_user
 
 @router.delete("/me")
 async def delete_current_user_account(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Delete current authenticated user's account"""
     
     # Mark user as inactive instead of hard delete
     current_user.is_active = False
-    db.commit()
+    await db.commit()
+    supabase_auth.invalidate_user(current_user.supabase_id)
     
     return {"message": "Account deactivated successfully"}
 
 @router.get("/profile/{user_id}", response_model=UserResponse)
 async def get_user_profile(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)  # Require authentication
 ):
     """Get another user's public profile"""
     
-    user = db.query(User).filter(User.id == user_id, User.is_active == True).first()
+    user = await db.scalar(select(User).where(User.id == user_id, User.is_active == True))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1,3 +1,3 @@
-from .supabase import get_current_user, get_optional_current_user, supabase_auth
+from .supabase import get_current_user, get_optional_current_user, authenticate_token, supabase_auth, close_auth_client
 
-__all__ = ["get_current_user", "get_optional_current_user", "supabase_auth"]
\ No newline at end of file
+__all__ = ["get_current_user", "get_optional_current_user", "authenticate_token", "supabase_auth", "close_auth_client"]
\ No newline at end of file
@@ -1,24 +1,193 @@
-from typing import Optional
-import os
+from typing import Dict, Optional
+from collections import OrderedDict
+import asyncio
+import hashlib
+import time
 import httpx
 from fastapi import HTTPException, status, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 from ..database import get_db
 from ..models.user import User
 from ..config import settings
+from ..services.tracing import tracer
+
+# Algorithms Supabase signs asymmetric access tokens with (keys served as JWKS)
+ASYMMETRIC_ALGORITHMS = {"RS256", "ES256"}
+# An unknown key id triggers a JWKS refetch at most this often (seconds)
+JWKS_MIN_REFRESH = 30.0
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def _unverified_expiry(token: str) -> Optional[float]:
+    try:
+        return jwt.get_unverified_claims(token).get("exp")
+    except JWTError:
+        return None
+
+def _token_key(token: str) -> str:
+    """Cache key for a token: its SHA-256, so raw tokens are not kept in memory"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class TTLCache:
+    """
+    Small in-process cache with LRU eviction and a TTL.
+
+    Entries may carry an earlier absolute expiry (e.g. a token's `exp`).
+    All access happens on the event loop thread, so no locking is needed.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value, expires_at: Optional[float] = None):
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        deadline = time.time() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        self._entries[key] = (value, deadline)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: str):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
 
 class SupabaseAuth:
     def __init__(self):
         self.supabase_url = settings.SUPABASE_URL
         self.supabase_key = settings.SUPABASE_KEY
-        self.jwt_secret = self.supabase_key  # Use anon key for JWT verification
+        self.jwt_secret = settings.SUPABASE_JWT_SECRET
+        self.audience = settings.SUPABASE_JWT_AUDIENCE
+        self.token_cache = TTLCache(settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TTL)
+        self.user_cache = TTLCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TTL)
+        
+        self._jwks: Dict[str, dict] = {}
+        self._jwks_fetched_at = float("-inf")
+        self._jwks_lock = asyncio.Lock()
+        self._client: Optional[httpx.AsyncClient] = None
         
         if not self.supabase_url or not self.supabase_key:
             raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY environment variables")
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared keep-alive client for JWKS fetches and the remote fallback"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(10.0, connect=5.0))
+        return self._client
+    
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
         
     async def verify_token(self, token: str) -> dict:
+        """
+        Verify a Supabase access token and return its user data.
+        
+        Checked locally against the JWT secret or the project's JWKS; only
+        tokens no local key can verify go to the Supabase user endpoint.
+        Results are cached by token hash until the token expires.
+        """
+        user_data = self.token_cache.get(_token_key(token))
+        if user_data is not None:
+            return user_data
+        
+        claims = await self._verify_locally(token)
+        if claims is not None:
+            user_data = {
+                "id": claims.get("sub"),
+                "email": claims.get("email"),
+                "user_metadata": claims.get("user_metadata") or {}
+            }
+            expiry = claims.get("exp")
+        elif settings.AUTH_REMOTE_FALLBACK:
+            user_data = await self._verify_remotely(token)
+            expiry = _unverified_expiry(token)
+        else:
+            raise _unauthorized("Could not verify authentication token")
+        
+        self.token_cache.put(_token_key(token), user_data, expiry)
+        return user_data
+    
+    async def _verify_locally(self, token: str) -> Optional[dict]:
+        """Claims of a locally verified token, or None when no local key applies"""
+        try:
+            header = jwt.get_unverified_header(token)
+        except JWTError:
+            raise _unauthorized("Invalid authentication token")
+        
+        algorithm = header.get("alg")
+        if algorithm == "HS256":
+            key = self.jwt_secret
+        elif algorithm in ASYMMETRIC_ALGORITHMS:
+            key = await self._signing_key(header.get("kid"))
+        else:
+            raise _unauthorized("Invalid authentication token")
+        if not key:
+            return None
+        
+        try:
+            return jwt.decode(
+                token,
+                key,
+                algorithms=[algorithm],
+                audience=self.audience or None,
+                options={"verify_aud": bool(self.audience)}
+            )
+        except JWTError:
+            raise _unauthorized("Invalid authentication token")
+    
+    async def _signing_key(self, kid: Optional[str]) -> Optional[dict]:
+        age = time.monotonic() - self._jwks_fetched_at
+        # Refetch when the cached set is stale, or on an unknown key id (rotation)
+        if age > settings.AUTH_JWKS_TTL or (kid not in self._jwks and age > JWKS_MIN_REFRESH):
+            await self._refresh_jwks()
+        return self._jwks.get(kid)
+    
+    async def _refresh_jwks(self):
+        async with self._jwks_lock:
+            if time.monotonic() - self._jwks_fetched_at < JWKS_MIN_REFRESH:
+                return  # Another request refreshed while we waited
+            try:
+                response = await self.client.get(
+                    f"{self.supabase_url}/auth/v1/.well-known/jwks.json",
+                    headers={"apikey": self.supabase_key}
+                )
+                response.raise_for_status()
+                self._jwks = {key.get("kid"): key for key in response.json().get("keys", [])}
+            except (httpx.HTTPError, ValueError) as e:
+                print(f"Error fetching Supabase JWKS: {str(e)}")
+            self._jwks_fetched_at = time.monotonic()
+    
+    async def _verify_remotely(self, token: str) -> dict:
         """Verify JWT token from Supabase by calling Supabase user endpoint"""
         try:
             # Use Supabase's user endpoint to validate the token
@@ -29,34 +198,27 @@ class SupabaseAuth:
             
             url = f"{self.supabase_url}/auth/v1/user"
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=headers)
-                
-                if response.status_code != 200:
-                    raise HTTPException(
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                        detail="Invalid authentication token",
-                        headers={"WWW-Authenticate": "Bearer"},
-                    )
-                
-                user_data = response.json()
-                return user_data
+            response = await self.client.get(url, headers=headers)
+            
+            if response.status_code != 200:
+                raise _unauthorized("Invalid authentication token")
+            
+            user_data = response.json()
+            return user_data
                 
         except httpx.RequestError:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not verify authentication token",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+            raise _unauthorized("Could not verify authentication token")
         except Exception:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication token",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+            raise _unauthorized("Invalid authentication token")
     
-    def get_user_from_token(self, user_data: dict, db: Session) -> User:
-        """Get or create user from Supabase user data"""
+    async def get_user_from_token(self, user_data: dict, db: AsyncSession) -> User:
+        """
+        Get or create user from Supabase user data.
+        
+        The user's row is cached by Supabase id, so a warm user costs no query:
+        the cached values are attached to `db` as an already-loaded instance.
+        Call invalidate_user() after changing a user.
+        """
         user_id = user_data.get("id")
         user_email = user_data.get("email")
         
@@ -66,32 +228,48 @@ class SupabaseAuth:
                 detail="Invalid user data from Supabase"
             )
         
+        cached = self.user_cache.get(user_id)
+        if cached is not None:
+            user = User(**cached)
+            make_transient_to_detached(user)
+            return await db.merge(user, load=False)
+        
         # Check if user exists in our database
-        user = db.query(User).filter(User.supabase_id == user_id).first()
+        user = await db.scalar(select(User).where(User.supabase_id == user_id))
         
         if not user:
-            # Create new user if doesn't exist
+            # Create new user if doesn't exist; concurrent first requests
+            # of the same user may race here, so insert-or-ignore
             user_metadata = user_data.get("user_metadata", {})
-            user = User(
-                supabase_id=user_id,
-                email=user_email,
-                full_name=user_metadata.get("full_name"),
-                avatar_url=user_metadata.get("avatar_url"),
-                is_active=True
+            insert = postgresql.insert if settings.is_postgresql else sqlite.insert
+            await db.execute(
+                insert(User).values(
+                    supabase_id=user_id,
+                    email=user_email,
+                    full_name=user_metadata.get("full_name"),
+                    avatar_url=user_metadata.get("avatar_url"),
+                    is_active=True
+                ).on_conflict_do_nothing(index_elements=["supabase_id"])
             )
-            db.add(user)
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            user = await db.scalar(select(User).where(User.supabase_id == user_id))
         
+        self.user_cache.put(user_id, {column.key: getattr(user, column.key) for column in User.__table__.columns})
         return user
+    
+    def invalidate_user(self, supabase_id: str):
+        self.user_cache.invalidate(supabase_id)
 
 # Security scheme for FastAPI
 security = HTTPBearer()
 supabase_auth = SupabaseAuth()
 
+async def close_auth_client():
+    await supabase_auth.close()
+
 async def get_current_user(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> User:
     """Dependency to get current authenticated user"""
     
@@ -106,9 +284,14 @@ async def get_current_user(
         )
     token = auth_header.replace("Bearer ", "")
     
-    # Verify token and get user
-    user_data = await supabase_auth.verify_token(token)
-    user = supabase_auth.get_user_from_token(user_data, db)
+    return await authenticate_token(token, db)
+
+async def authenticate_token(token: str, db: AsyncSession) -> User:
+    """Resolve a bearer token to an active user; also used where no Authorization header is available (WebSockets)"""
+    with tracer.start_as_current_span("auth.verify_token"):
+        user_data = await supabase_auth.verify_token(token)
+    with tracer.start_as_current_span("auth.load_user"):
+        user = await supabase_auth.get_user_from_token(user_data, db)
     
     if not user.is_active:
         raise HTTPException(
@@ -120,7 +303,7 @@ async def get_current_user(
 
 async def get_optional_current_user(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Optional[User]:
     """Optional dependency to get current authenticated user (doesn't fail if no auth)"""
     try:
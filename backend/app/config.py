@@ -1,10 +1,14 @@
 from pydantic_settings import BaseSettings
-from typing import List, Literal
+from typing import Any, Dict, List, Optional
 import os
 
 class Settings(BaseSettings):
     # Database configuration
     DATABASE_URL: str = "sqlite:///./app.db"
+    # PostgreSQL connection pool per process; DB_MAX_OVERFLOW defaults to
+    # AI_MAX_CONCURRENT_GENERATIONS + JOB_WORKERS
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: Optional[int] = None
     
     # Environment detection
     ENVIRONMENT: str = "development"
@@ -13,10 +17,122 @@ class Settings(BaseSettings):
     SUPABASE_URL: str = ""
     SUPABASE_KEY: str = ""
     
+    # Local token verification: the project's JWT secret for HS256 tokens;
+    # asymmetric tokens are checked against the project's JWKS (cached for
+    # AUTH_JWKS_TTL seconds). Verified tokens are cached up to
+    # AUTH_TOKEN_CACHE_TTL seconds (never past their expiry). Tokens that
+    # cannot be verified locally fall back to the Supabase user endpoint.
+    SUPABASE_JWT_SECRET: str = ""
+    SUPABASE_JWT_AUDIENCE: str = "authenticated"
+    AUTH_JWKS_TTL: float = 600.0
+    AUTH_TOKEN_CACHE_SIZE: int = 10000
+    AUTH_TOKEN_CACHE_TTL: float = 300.0
+    AUTH_REMOTE_FALLBACK: bool = True
+    
+    # Authenticated user rows cached by Supabase id (TTL in seconds); other
+    # workers see profile changes and deactivation once their entry expires
+    AUTH_USER_CACHE_SIZE: int = 10000
+    AUTH_USER_CACHE_TTL: float = 60.0
+    
     # AI Services
     OPENAI_API_KEY: str = ""
     ANTHROPIC_API_KEY: str = ""
-    AI_PROVIDER: Literal["openai", "anthropic"] = "anthropic"
+    AI_PROVIDER: str = "anthropic"  # Any registered provider: "anthropic", "openai", "mock"
+    
+    # Per-provider, per-task overrides of model/max_tokens/temperature/timeout, e.g.
+    # {"anthropic": {"title": {"model": "claude-3-5-haiku-20241022", "max_tokens": 60}}}
+    AI_TASK_CONFIG: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    
+    # Failover: providers tried after AI_PROVIDER, in order. Interactive turns
+    # are hedged to the next provider after AI_HEDGE_DELAY seconds (0 = use the
+    # provider's rolling p95, floored at AI_HEDGE_MIN_DELAY)
+    AI_FALLBACK_PROVIDERS: List[str] = []
+    AI_HEDGE_DELAY: float = 0.0
+    AI_HEDGE_MIN_DELAY: float = 1.0
+    AI_HEDGE_DEFAULT_DELAY: float = 8.0
+    AI_STATS_WINDOW: float = 300.0
+    
+    # Circuit breaker per provider
+    AI_BREAKER_FAILURES: int = 5
+    AI_BREAKER_ERROR_RATE: float = 0.5
+    AI_BREAKER_MIN_CALLS: int = 10
+    AI_BREAKER_COOLDOWN: float = 30.0
+    
+    # Generation scheduler: concurrent calls overall and per user, queue size,
+    # how long interactive/background calls may wait for a slot (seconds), and
+    # a requests-per-minute budget matching the provider quota (0 = unlimited),
+    # with a share of the bucket held back for interactive turns
+    AI_MAX_CONCURRENT_GENERATIONS: int = 32
+    AI_MAX_CONCURRENT_PER_USER: int = 3
+    AI_MAX_QUEUED_GENERATIONS: int = 100
+    AI_QUEUE_TIMEOUT_INTERACTIVE: float = 5.0
+    AI_QUEUE_TIMEOUT_BACKGROUND: float = 60.0
+    AI_RATE_LIMIT_PER_MINUTE: float = 0.0
+    AI_RATE_LIMIT_BURST: int = 20
+    AI_RATE_LIMIT_INTERACTIVE_RESERVE: float = 0.25
+    
+    # Mock provider (offline load testing): latency before the first token,
+    # delay between tokens (seconds) and canned output
+    MOCK_LLM_LATENCY: float = 0.5
+    MOCK_LLM_TOKEN_DELAY: float = 0.02
+    MOCK_LLM_RESPONSE: str = "That is an interesting point. Learning grows out of experience, so I would ask what the learners themselves bring to this question."
+    MOCK_LLM_SHOULD_CONTINUE: bool = True
+    MOCK_LLM_TITLE: str = "Mock Conversation"
+    
+    # AI HTTP transport (timeouts in seconds)
+    AI_REQUEST_TIMEOUT: float = 60.0
+    AI_TITLE_TIMEOUT: float = 20.0
+    AI_CONNECT_TIMEOUT: float = 5.0
+    AI_MAX_CONNECTIONS: int = 200
+    AI_MAX_KEEPALIVE_CONNECTIONS: int = 50
+    
+    # Background jobs: workers per process (0 = don't run jobs here), idle
+    # poll interval and lease length (seconds), attempts per job, and the
+    # exponential retry backoff (seconds)
+    JOB_WORKERS: int = 8
+    JOB_POLL_INTERVAL: float = 1.0
+    JOB_LEASE_SECONDS: float = 120.0
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BASE_DELAY: float = 2.0
+    JOB_RETRY_MAX_DELAY: float = 300.0
+    
+    # Idempotency-Key support: how long completed responses are replayed, and
+    # how long a repeat waits for the original request to finish (seconds)
+    IDEMPOTENCY_TTL: float = 86400.0
+    IDEMPOTENCY_WAIT_TIMEOUT: float = 120.0
+    
+    # Transcript cache (conversations kept in memory, TTL in seconds)
+    TRANSCRIPT_CACHE_SIZE: int = 500
+    TRANSCRIPT_CACHE_TTL: float = 900.0
+    
+    # Character catalog cache (users with a cached private slice, TTL in seconds)
+    CHARACTER_CATALOG_USERS: int = 1000
+    CHARACTER_CATALOG_TTL: float = 300.0
+    
+    # Opening-turn cache: first turns of new conversations, per character,
+    # personality, prompt and model. Up to OPENING_CACHE_POOL_SIZE openings
+    # are kept per key and rotated (0 = disabled); TTL in seconds
+    OPENING_CACHE_POOL_SIZE: int = 3
+    OPENING_CACHE_TTL: float = 21600.0
+    OPENING_CACHE_KEYS: int = 1000
+    
+    # Prompt context window: token budget for history, turns always kept verbatim,
+    # and how many extra turns accumulate before they are folded into the summary
+    CONTEXT_MAX_TOKENS: int = 6000
+    CONTEXT_KEEP_TURNS: int = 12
+    CONTEXT_SUMMARY_BATCH: int = 8
+    
+    # Prometheus metrics at /metrics (per process; scrape every worker)
+    METRICS_ENABLED: bool = True
+    
+    # Tracing: TRACE_EXPORTER "file" (JSON lines to TRACE_FILE) or "otlp"
+    # (TRACE_OTLP_ENDPOINT, else the OTEL_EXPORTER_OTLP_* variables); empty
+    # disables it. TRACE_SAMPLE_RATE is the share of new traces recorded
+    TRACE_EXPORTER: str = ""
+    TRACE_FILE: str = "traces.jsonl"
+    TRACE_OTLP_ENDPOINT: Optional[str] = None
+    TRACE_SAMPLE_RATE: float = 0.1
+    TRACE_SERVICE_NAME: str = "chatlab-api"
     
     # CORS Configuration
     CORS_ORIGINS: List[str] = [
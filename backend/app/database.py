@@ -1,7 +1,11 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
+from .services.metrics import instrument_engine
+from .services.tracing import instrument_engine as trace_engine, tracer
 
 # Get the database URL using the new configuration method
 DATABASE_URL = settings.get_database_url()
@@ -23,20 +27,80 @@ else:
         echo=False  # Set to True for SQL debugging
     )
 
+# Sync sessions are kept for scripts, startup checks and Alembic
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-def get_db():
+def get_async_database_url(url: str = DATABASE_URL):
+    """Rewrite the configured URL for the async drivers (asyncpg, aiosqlite)"""
+    async_url = make_url(url)
+    connect_args = {}
+    if async_url.drivername in ("postgresql", "postgres", "postgresql+psycopg2"):
+        async_url = async_url.set(drivername="postgresql+asyncpg")
+        # asyncpg takes `ssl` instead of libpq's sslmode query parameter
+        sslmode = async_url.query.get("sslmode")
+        if sslmode:
+            async_url = async_url.difference_update_query(["sslmode"])
+            if sslmode != "disable":
+                connect_args["ssl"] = sslmode
+    elif async_url.drivername in ("sqlite", "sqlite+pysqlite"):
+        async_url = async_url.set(drivername="sqlite+aiosqlite")
+    return async_url, connect_args
+
+ASYNC_DATABASE_URL, _async_connect_args = get_async_database_url()
+
+if settings.is_postgresql:
+    # Turns hold a connection only on either side of the provider call, but
+    # every generation slot and job worker may need one at the same moment
+    max_overflow = settings.DB_MAX_OVERFLOW
+    if max_overflow is None:
+        max_overflow = settings.AI_MAX_CONCURRENT_GENERATIONS + settings.JOB_WORKERS
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        connect_args=_async_connect_args,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=max_overflow,
+        pool_pre_ping=True,
+        pool_recycle=300,
+        echo=False
+    )
+else:
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False)
+
+# Statement timings and pool checkouts for /metrics, and a span per statement
+instrument_engine(async_engine.sync_engine)
+trace_engine(async_engine.sync_engine)
+
+# expire_on_commit=False: attributes stay readable after commit without an
+# implicit (and, under asyncio, impossible) lazy refresh
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+async def get_db():
     """Database dependency for FastAPI"""
-    db = SessionLocal()
+    # Not made current: the span outlives this frame's context across the yield
+    span = tracer.start_span("db.session")
     try:
-        yield db
+        async with AsyncSessionLocal() as db:
+            yield db
     finally:
-        db.close()
+        span.end()
+
+async def release_connection(db: AsyncSession):
+    """
+    End the session's transaction so its pooled connection goes back before a
+    slow await such as a provider call. Loaded objects stay usable
+    (expire_on_commit=False); the next statement checks a connection out again.
+    """
+    await db.commit()
 
 async def create_tables():
     """Create all database tables"""
-    Base.metadata.create_all(bind=engine)
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+async def close_db():
+    """Dispose of the async connection pool (called on application shutdown)"""
+    await async_engine.dispose()
 
 def get_database_info():
     """Get information about the current database configuration"""
@@ -45,4 +109,4 @@ def get_database_info():
         "is_postgresql": settings.is_postgresql,
         "is_production": settings.is_production,
         "environment": settings.ENVIRONMENT
-    }
\ No newline at end of file
+    }
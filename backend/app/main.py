@@ -1,13 +1,22 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from sqlalchemy import text
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from opentelemetry import propagate
+from opentelemetry.trace import SpanKind
 import time
 import logging
 
 from .config import settings
-from .database import create_tables
-from .api import auth, users, characters, conversations, ai
+from .database import create_tables, close_db
+from .services.ai_service import close_ai_clients
+from .services.events import close_event_broker
+from .services.jobs import job_workers
+from .services.metrics import observe_request, route_template, start_request_stats
+from .services.tracing import TRACE_HEADER, configure_tracing, current_trace_id, shutdown_tracing, tracer
+from .auth import close_auth_client
+from .api import auth, users, characters, conversations, ai, jobs
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,6 +33,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Idempotent-Replayed", TRACE_HEADER],
 )
 
 app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
@@ -31,29 +41,73 @@ app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
 @app.middleware("http")
 async def log_requests(request, call_next):
     start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
+    query_stats = start_request_stats()
+    # Continues the caller's trace when it sends a traceparent header
+    with tracer.start_as_current_span(
+        request.method, context=propagate.extract(request.headers), kind=SpanKind.SERVER
+    ) as span:
+        response = await call_next(request)
+        process_time = time.time() - start_time
+        route = route_template(request)
+        
+        span.update_name(f"{request.method} {route}")
+        if span.is_recording():
+            span.set_attribute("http.method", request.method)
+            span.set_attribute("http.route", route)
+            span.set_attribute("http.status_code", response.status_code)
+            span.set_attribute("db.query_count", query_stats.count)
+        trace_id = current_trace_id()
+        if trace_id:
+            response.headers[TRACE_HEADER] = trace_id
     
+    if request.url.path != "/metrics":
+        observe_request(request.method, route, response.status_code, process_time, query_stats)
     if request.url.path.startswith("/api"):
-        logger.info(f"{request.method} {request.url.path} {response.status_code} in {process_time:.4f}s")
+        logger.info(
+            f"{request.method} {request.url.path} {response.status_code} in {process_time:.4f}s "
+            f"({query_stats.count} queries, {query_stats.seconds:.4f}s)"
+            + (f" trace={trace_id}" if trace_id else "")
+        )
     
     return response
 
 @app.on_event("startup")
 async def startup_event():
+    configure_tracing()
     await create_tables()
     logger.info("Database tables created")
+    if settings.JOB_WORKERS > 0:
+        job_workers.start(settings.JOB_WORKERS)
+        logger.info(f"Started {settings.JOB_WORKERS} job workers")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Running jobs go back to the queue for the next worker
+    await job_workers.stop()
+    await close_ai_clients()
+    await close_event_broker()
+    await close_auth_client()
+    await close_db()
+    shutdown_tracing()
 
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(users.router, tags=["users"])
 app.include_router(characters.router, prefix="/api/characters", tags=["characters"])
 app.include_router(conversations.router, prefix="/api/conversations", tags=["conversations"])
 app.include_router(ai.router, prefix="/api/ai", tags=["ai"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
 
 @app.get("/")
 async def root():
     return {"message": "ChatLab API"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics for this process"""
+    if not settings.METRICS_ENABLED:
+        return Response(status_code=404)
+    return Response(generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
@@ -62,15 +116,15 @@ async def health_check():
 async def database_health_check():
     """Check database connectivity and return database information"""
     try:
-        from .database import get_database_info, engine
+        from .database import get_database_info, async_engine
         
         # Test database connection
-        with engine.connect() as conn:
+        async with async_engine.connect() as conn:
             # Get database info
             db_info = get_database_info()
             
             # Test a simple query
-            result = conn.execute(text("SELECT 1"))
+            result = await conn.execute(text("SELECT 1"))
             query_result = result.scalar()
             
             return {
@@ -2,5 +2,7 @@ from .user import User
 from .character import Character
 from .conversation import Conversation
 from .message import Message
+from .job import Job
+from .idempotency_key import IdempotencyKey
 
-__all__ = ["User", "Character", "Conversation", "Message"]
\ No newline at end of file
+__all__ = ["User", "Character", "Conversation", "Message", "Job", "IdempotencyKey"]
\ No newline at end of file
@@ -1,10 +1,15 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from ..database import Base
 
 class Character(Base):
     __tablename__ = "characters"
+    __table_args__ = (
+        # Each branch of the catalog filter (built-in/own, public) gets an index
+        Index("ix_characters_created_by_id", "created_by_id"),
+        Index("ix_characters_is_public", "is_public"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False)
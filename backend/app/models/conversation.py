@@ -1,10 +1,19 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, JSON, ForeignKey, Text
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, JSON, ForeignKey, Text, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from ..database import Base
 
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        # A user's conversation list, most recently updated first
+        Index("ix_conversations_user_id_updated_at", "user_id", "updated_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(500), nullable=False)
@@ -12,8 +21,12 @@ class Conversation(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     is_autonomous = Column(Boolean, default=False, nullable=False)
     current_turn = Column(Integer, default=0, nullable=False)
+    summary = Column(Text, nullable=True)  # Running summary of turns older than the context window
+    summary_turn = Column(Integer, default=0, server_default="0", nullable=False)  # Last turn folded into summary
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # Set in Python rather than by the database so that SQLite stores one text
+    # format (with microseconds), which sorts and compares correctly as is
+    updated_at = Column(DateTime(timezone=True), default=_utcnow, onupdate=_utcnow, server_default=func.now(), nullable=False)
     
     # Relationships
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
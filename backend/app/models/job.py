@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON, Index
+from sqlalchemy.sql import func
+from ..database import Base
+
+class Job(Base):
+    """Queued LLM work (character responses, titles) run by the job workers"""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Workers claim the oldest runnable job
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+        Index("ix_jobs_conversation_id", "conversation_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)  # "generate_response" or "generate_title"
+    conversation_id = Column(Integer, ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    payload = Column(JSON, nullable=False, default=dict)
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, succeeded, failed
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=3, nullable=False)
+    run_after = Column(DateTime(timezone=True), nullable=False)  # Not claimed before this (retry backoff)
+    locked_until = Column(DateTime(timezone=True), nullable=True)  # Lease; an expired lease is claimed again
+    locked_by = Column(String(100), nullable=True)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,10 +1,15 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from ..database import Base
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Conversation history is always read by conversation, in turn order;
+        # unique so concurrent writers can never share a turn
+        Index("uq_messages_conversation_id_turn_number", "conversation_id", "turn_number", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
@@ -1,11 +1,13 @@
 from .user import UserCreate, UserResponse, UserUpdate, UserPublicProfile
 from .character import CharacterCreate, CharacterUpdate, CharacterResponse
 from .conversation import ConversationCreate, ConversationUpdate, ConversationResponse
-from .message import MessageCreate, MessageResponse
+from .message import MessageCreate, MessageResponse, ConversationMessageResponse
+from .job import JobCreate, JobResponse
 
 __all__ = [
     "UserCreate", "UserResponse", "UserUpdate", "UserPublicProfile",
     "CharacterCreate", "CharacterUpdate", "CharacterResponse",
     "ConversationCreate", "ConversationUpdate", "ConversationResponse", 
-    "MessageCreate", "MessageResponse"
+    "MessageCreate", "MessageResponse", "ConversationMessageResponse",
+    "JobCreate", "JobResponse"
 ]
\ No newline at end of file
@@ -1,7 +1,7 @@
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
-from .message import MessageResponse
+from .message import ConversationMessageResponse
 from .character import CharacterResponse
 
 class ConversationBase(BaseModel):
@@ -28,5 +28,17 @@ class ConversationResponse(ConversationBase):
         from_attributes = True
 
 class ConversationWithMessages(ConversationResponse):
-    messages: List[MessageResponse] = []
-    participants: List[CharacterResponse] = []
\ No newline at end of file
+    messages: List[ConversationMessageResponse] = []
+    participants: List[CharacterResponse] = []
+    # Characters who spoke earlier but are no longer participants
+    former_participants: List[CharacterResponse] = []
+    # Pass as before_turn to load the previous page of messages (None: no older messages)
+    next_cursor: Optional[int] = None
+
+class ConversationChanges(ConversationResponse):
+    """Messages after the client's watermark, with the conversation's current fields"""
+    messages: List[ConversationMessageResponse] = []
+    participants: List[CharacterResponse] = []
+    former_participants: List[CharacterResponse] = []
+    # Highest turn the client now has; send it as since_turn next time
+    last_turn: int
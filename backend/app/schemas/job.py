@@ -0,0 +1,25 @@
+from pydantic import BaseModel
+from typing import Literal, Optional
+from datetime import datetime
+
+class JobCreate(BaseModel):
+    kind: Literal["generate_response", "generate_title"]
+    conversation_id: int
+    character_id: Optional[int] = None  # Required for generate_response
+    user_prompt: Optional[str] = None
+
+class JobResponse(BaseModel):
+    id: int
+    kind: str
+    conversation_id: int
+    status: str
+    attempts: int
+    max_attempts: int
+    run_after: datetime
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
@@ -14,7 +14,7 @@ class MessageCreate(BaseModel):
     character_id: Optional[int] = None
     content: str
     is_user_prompt: bool = False
-    turn_number: int
+    turn_number: Optional[int] = None  # Ignored: the server allocates turns
 
 class MessageResponse(MessageBase):
     id: int
@@ -22,4 +22,12 @@ class MessageResponse(MessageBase):
     character: Optional[CharacterResponse] = None
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class ConversationMessageResponse(MessageBase):
+    """Message inside a conversation detail; the speaker is referenced by character_id"""
+    id: int
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
@@ -1,49 +1,42 @@
 import json
-from openai import OpenAI
-from anthropic import Anthropic
-from typing import Dict, Any
+import re
+from typing import Awaitable, Callable, Dict, AsyncIterator, Hashable, Optional
 from ..config import settings
+from .llm import (
+    LLMRequest, ProviderUnavailableError, SchedulerOverloadedError, Priority,
+    llm_router, llm_scheduler, close_providers, close_http_client, task_config
+)
+from .opening_cache import Opening, opening_cache, opening_fingerprint
+from .tracing import tracer
 
-# Initialize clients
-openai_client = None
-anthropic_client = None
+# Prompt context of a conversation with no messages yet
+EMPTY_HISTORY = "This is the beginning of the conversation."
 
-if settings.OPENAI_API_KEY and settings.OPENAI_API_KEY not in ["sk-fake-key-for-development", "your_openai_key"]:
-    openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
+TITLE_SYSTEM_PROMPT = "Generate a concise, engaging title (2-6 words) for this conversation. Respond in JSON format: {\"title\": \"your title\"}"
 
-if settings.ANTHROPIC_API_KEY and settings.ANTHROPIC_API_KEY not in ["sk-ant-REDACTED", "your_anthropic_key"]:
-    print(f"Initializing Anthropic client with key starting with: {settings.ANTHROPIC_API_KEY[:10]}...")
-    anthropic_client = Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-else:
-    print(f"Anthropic key not valid: {settings.ANTHROPIC_API_KEY[:20] if settings.ANTHROPIC_API_KEY else 'None'}...")
+async def close_ai_clients():
+    """Close provider clients and the shared HTTP transport (called on application shutdown)"""
+    await close_providers()
+    await close_http_client()
 
 class CharacterResponse:
-    def __init__(self, content: str, should_continue: bool):
+    def __init__(self, content: str, should_continue: bool, usage: Optional[Dict[str, int]] = None):
         self.content = content
         self.should_continue = should_continue
+        self.usage = usage or {}
 
-async def generate_character_response(
+def _character_request(
     character_name: str,
     character_personality: str,
     conversation_history: str,
     user_prompt: str = None
-) -> CharacterResponse:
-    try:
-        if settings.AI_PROVIDER == "anthropic" and anthropic_client:
-            return await _generate_with_anthropic(character_name, character_personality, conversation_history, user_prompt)
-        elif settings.AI_PROVIDER == "openai" and openai_client:
-            return await _generate_with_openai(character_name, character_personality, conversation_history, user_prompt)
-        else:
-            raise Exception(f"AI provider '{settings.AI_PROVIDER}' not configured or API key missing")
-    except Exception as error:
-        raise Exception(f"Failed to generate response for {character_name}: {str(error)}")
-
-async def _generate_with_anthropic(
-    character_name: str,
-    character_personality: str,
-    conversation_history: str,
-    user_prompt: str = None
-) -> CharacterResponse:
+) -> LLMRequest:
+    """
+    Build the request for a character turn.
+    
+    The transcript is kept separate from the per-turn tail so providers can
+    prompt-cache the stable prefix (system prompt, then transcript).
+    """
     system_prompt = f"""You are {character_name}. {character_personality}
 
 Instructions:
@@ -55,121 +48,312 @@ Instructions:
 - Respond in JSON format: {{"content": "your response", "shouldContinue": true/false}}
 - Set shouldContinue to true if the conversation should naturally continue, false if it feels like a natural ending point"""
 
-    user_message = f"Conversation so far:\n{conversation_history}"
+    transcript = f"Conversation so far:\n{conversation_history}"
+    tail = ""
     if user_prompt:
-        user_message += f"\n\nUser prompt: {user_prompt}"
-    user_message += f"\n\nPlease respond as {character_name}:"
+        tail += f"\n\nUser prompt: {user_prompt}"
+    tail += f"\n\nPlease respond as {character_name}:"
 
-    response = anthropic_client.messages.create(
-        model="claude-3-5-sonnet-20241022",
-        max_tokens=1000,
-        temperature=0.8,
+    return LLMRequest(
+        task="character",
         system=system_prompt,
-        messages=[
-            {"role": "user", "content": user_message}
-        ]
+        transcript=transcript,
+        tail=tail,
+        json_output=True
     )
 
+def _parse_character_result(text: str) -> CharacterResponse:
     try:
-        result = json.loads(response.content[0].text)
+        result = json.loads(text)
     except json.JSONDecodeError:
         # If response isn't JSON, wrap it
-        result = {"content": response.content[0].text, "shouldContinue": True}
+        result = {"content": text, "shouldContinue": True}
     
     return CharacterResponse(
         content=result.get("content", "I need a moment to think."),
         should_continue=result.get("shouldContinue", True)
     )
 
-async def _generate_with_openai(
+def _opening_key(character_name: str, character_personality: str, user_prompt: str) -> Optional[str]:
+    """Opening-cache key for a first turn with the current provider's model; None when not cacheable"""
+    if not opening_cache.enabled:
+        return None
+    try:
+        model = task_config(settings.AI_PROVIDER, "character").model
+    except KeyError:
+        return None
+    return opening_fingerprint(character_name, character_personality, user_prompt, f"{settings.AI_PROVIDER}:{model}")
+
+async def generate_character_response(
     character_name: str,
     character_personality: str,
     conversation_history: str,
-    user_prompt: str = None
+    user_prompt: str = None,
+    user_key: Optional[Hashable] = None,
+    priority: Priority = Priority.INTERACTIVE
 ) -> CharacterResponse:
-    system_prompt = f"""You are {character_name}. {character_personality}
+    """
+    Generate a character turn. First turns (empty history) are served from
+    the opening cache when possible, without calling the provider.
+    """
+    with tracer.start_as_current_span("ai.character_response") as span:
+        span.set_attribute("character.name", character_name)
+        key = _opening_key(character_name, character_personality, user_prompt) if conversation_history == EMPTY_HISTORY else None
+        if key is None:
+            return await _generate_character_response(
+                character_name, character_personality, conversation_history, user_prompt, user_key, priority
+            )
+        
+        fresh: Optional[CharacterResponse] = None
+        
+        async def generate() -> Opening:
+            nonlocal fresh
+            fresh = await _generate_character_response(
+                character_name, character_personality, conversation_history, user_prompt, user_key, priority
+            )
+            return fresh.content, fresh.should_continue
+        
+        (content, should_continue), cached = await opening_cache.get(
+            key, generate, _opening_refill(character_name, character_personality, user_prompt)
+        )
+        span.set_attribute("ai.opening_cache_hit", cached)
+        return CharacterResponse(content, should_continue) if cached else fresh
 
-Instructions:
-- Stay in character at all times
-- Respond naturally as {character_name} would, considering your personality and expertise
-- Keep responses conversational but substantial (2-4 sentences typically)
-- Build on previous messages in the conversation
-- Ask questions or make points that could lead to interesting dialogue
-- Respond in JSON format: {{"content": "your response", "shouldContinue": true/false}}
-- Set shouldContinue to true if the conversation should naturally continue, false if it feels like a natural ending point"""
+def _opening_refill(character_name: str, character_personality: str, user_prompt: str) -> Callable[[], Awaitable[Opening]]:
+    async def refill() -> Opening:
+        response = await _generate_character_response(
+            character_name, character_personality, EMPTY_HISTORY, user_prompt, None, Priority.BACKGROUND
+        )
+        return response.content, response.should_continue
+    return refill
 
-    user_message = f"Conversation so far:\n{conversation_history}"
-    if user_prompt:
-        user_message += f"\n\nUser prompt: {user_prompt}"
-    user_message += f"\n\nPlease respond as {character_name}:"
-
-    response = openai_client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message}
-        ],
-        response_format={"type": "json_object"},
-        temperature=0.8,
-    )
+async def _generate_character_response(
+    character_name: str,
+    character_personality: str,
+    conversation_history: str,
+    user_prompt: str,
+    user_key: Optional[Hashable],
+    priority: Priority
+) -> CharacterResponse:
+    try:
+        async with llm_scheduler.slot(user_key, priority):
+            with tracer.start_as_current_span("ai.build_prompt"):
+                request = _character_request(character_name, character_personality, conversation_history, user_prompt)
+            result = await llm_router.complete(request)
+    except (ProviderUnavailableError, SchedulerOverloadedError):
+        raise
+    except Exception as error:
+        raise Exception(f"Failed to generate response for {character_name}: {str(error)}")
+    
+    with tracer.start_as_current_span("ai.parse_response"):
+        response = _parse_character_result(result.text or '{"content": "I need a moment to think.", "shouldContinue": false}')
+    response.usage = result.usage
+    return response
+
+class _JSONContentExtractor:
+    """Incrementally pull the decoded "content" string out of a streamed JSON reply.
+
+    Characters are asked to answer as {"content": ..., "shouldContinue": ...};
+    this lets us forward the content to the client token by token without
+    waiting for the closing brace. Replies that are not JSON at all are
+    passed through unchanged.
+    """
+
+    _KEY = re.compile(r'"content"\s*:\s*"')
+
+    def __init__(self):
+        self._buffer = ""
+        self._state = "start"  # start -> seek -> string -> done, or raw
+        self._escape = ""
+
+    def feed(self, text: str) -> str:
+        if self._state == "done":
+            return ""
+        if self._state == "raw":
+            return text
+
+        self._buffer += text
+        if self._state == "start":
+            stripped = self._buffer.lstrip()
+            if not stripped:
+                return ""
+            self._state = "seek" if stripped.startswith("{") else "raw"
+            if self._state == "raw":
+                out, self._buffer = self._buffer, ""
+                return out
+
+        if self._state == "seek":
+            match = self._KEY.search(self._buffer)
+            if not match:
+                return ""
+            self._buffer = self._buffer[match.end():]
+            self._state = "string"
+
+        return self._drain()
+
+    def _drain(self) -> str:
+        out = []
+        for char in self._buffer:
+            if self._escape:
+                self._escape += char
+                if not self._escape_complete():
+                    continue
+                out.append(json.loads(f'"{self._escape}"'))
+                self._escape = ""
+            elif char == "\\":
+                self._escape = char
+            elif char == '"':
+                self._state = "done"
+                break
+            else:
+                out.append(char)
+        self._buffer = ""
+        return "".join(out)
+
+    def _escape_complete(self) -> bool:
+        if self._escape[1] != "u":
+            return True
+        if len(self._escape) < 6:
+            return False
+        # A high surrogate must be decoded together with its low half
+        if 0xD800 <= int(self._escape[2:6], 16) <= 0xDBFF:
+            return len(self._escape) == 12
+        return True
+
+class CharacterResponseStream:
+    """Async iterator over content deltas of a character turn.
+
+    Once iteration finishes, ``result`` holds the parsed CharacterResponse
+    for the complete reply. ``close()`` gives back the scheduler slot; it
+    runs when iteration ends and is safe to call again.
+    """
+
+    def __init__(
+        self,
+        chunks: AsyncIterator[str],
+        usage: Optional[Dict[str, int]] = None,
+        on_close: Optional[Callable[[], None]] = None,
+        on_result: Optional[Callable[[CharacterResponse], None]] = None
+    ):
+        self._chunks = chunks
+        self._usage = usage if usage is not None else {}
+        self._on_close = on_close
+        self._on_result = on_result
+        self.result: Optional[CharacterResponse] = None
+
+    def close(self):
+        if self._on_close:
+            self._on_close()
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        extractor = _JSONContentExtractor()
+        raw = []
+        try:
+            async for chunk in self._chunks:
+                raw.append(chunk)
+                delta = extractor.feed(chunk)
+                if delta:
+                    yield delta
+        finally:
+            self.close()
+        self.result = _parse_character_result("".join(raw))
+        self.result.usage = self._usage
+        if self._on_result:
+            self._on_result(self.result)
 
-    result = json.loads(response.choices[0].message.content or '{"content": "I need a moment to think.", "shouldContinue": false}')
+async def _replay(text: str) -> AsyncIterator[str]:
+    yield text
+
+async def stream_character_response(
+    character_name: str,
+    character_personality: str,
+    conversation_history: str,
+    user_prompt: str = None,
+    user_key: Optional[Hashable] = None,
+    priority: Priority = Priority.INTERACTIVE
+) -> CharacterResponseStream:
+    """
+    Reserve a scheduler slot and open the stream.
+
+    The slot is taken up front so overload surfaces as SchedulerOverloadedError
+    before any response has started; it is held until the stream is consumed
+    or closed. A cached opening (see generate_character_response) is replayed
+    as a single chunk; a streamed first turn is added to the opening cache.
+    """
+    key = _opening_key(character_name, character_personality, user_prompt) if conversation_history == EMPTY_HISTORY else None
+    on_result = None
+    if key is not None:
+        opening = opening_cache.take(key)
+        if opening is not None:
+            opening_cache.schedule_refill(key, _opening_refill(character_name, character_personality, user_prompt))
+            content, should_continue = opening
+            return CharacterResponseStream(_replay(json.dumps({"content": content, "shouldContinue": should_continue})))
+        on_result = lambda response: opening_cache.put(key, (response.content, response.should_continue))
     
-    return CharacterResponse(
-        content=result.get("content", "I need a moment to think."),
-        should_continue=result.get("shouldContinue", True)
+    slot = await llm_scheduler.acquire(user_key, priority)
+    usage: Dict[str, int] = {}
+    chunks = llm_router.stream(
+        _character_request(character_name, character_personality, conversation_history, user_prompt),
+        usage
     )
+    return CharacterResponseStream(chunks, usage, on_close=slot.release, on_result=on_result)
 
-async def generate_conversation_title(first_few_messages: str) -> str:
+async def generate_conversation_title(first_few_messages: str, user_key: Optional[Hashable] = None) -> str:
+    with tracer.start_as_current_span("ai.conversation_title"):
+        return await _generate_conversation_title(first_few_messages, user_key)
+
+async def _generate_conversation_title(first_few_messages: str, user_key: Optional[Hashable]) -> str:
     try:
-        if settings.AI_PROVIDER == "anthropic" and anthropic_client:
-            return await _generate_title_with_anthropic(first_few_messages)
-        elif settings.AI_PROVIDER == "openai" and openai_client:
-            return await _generate_title_with_openai(first_few_messages)
-        else:
-            return "Untitled Conversation"
+        async with llm_scheduler.slot(user_key, Priority.BACKGROUND):
+            result = await llm_router.complete(
+                LLMRequest(
+                    task="title",
+                    system=TITLE_SYSTEM_PROMPT,
+                    tail=f"Conversation excerpt:\n{first_few_messages}",
+                    json_output=True
+                ),
+                hedge=False
+            )
+    except SchedulerOverloadedError:
+        # Let the caller answer 429 rather than saving a placeholder title
+        raise
     except Exception as error:
         print(f"Error generating conversation title: {error}")
         return "Untitled Conversation"
-
-async def _generate_title_with_anthropic(first_few_messages: str) -> str:
-    response = anthropic_client.messages.create(
-        model="claude-3-5-sonnet-20241022",
-        max_tokens=100,
-        temperature=0.7,
-        system="Generate a concise, engaging title (2-6 words) for this conversation. Respond in JSON format: {\"title\": \"your title\"}",
-        messages=[
-            {
-                "role": "user",
-                "content": f"Conversation excerpt:\n{first_few_messages}"
-            }
-        ]
-    )
-
+    
     try:
-        result = json.loads(response.content[0].text)
-        return result.get("title", "Untitled Conversation")
+        return json.loads(result.text).get("title", "Untitled Conversation")
     except json.JSONDecodeError:
         # If response isn't JSON, use the text directly (truncated)
-        title = response.content[0].text.strip()
+        title = result.text.strip()
         return title[:50] if len(title) > 50 else title
 
-async def _generate_title_with_openai(first_few_messages: str) -> str:
-    response = openai_client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {
-                "role": "system",
-                "content": "Generate a concise, engaging title (2-6 words) for this conversation. Respond in JSON format: {\"title\": \"your title\"}"
-            },
-            {
-                "role": "user",
-                "content": f"Conversation excerpt:\n{first_few_messages}"
-            }
-        ],
-        response_format={"type": "json_object"},
-        temperature=0.7,
+SUMMARY_SYSTEM_PROMPT = """You maintain a running summary of a multi-character discussion.
+Merge the new messages into the existing summary. Keep who said what, the positions each participant holds, points of agreement and disagreement, and any open questions. Write plain prose, at most 250 words. Respond with the summary only."""
+
+def _build_summary_message(previous_summary: Optional[str], new_messages: str) -> str:
+    return (
+        f"Existing summary:\n{previous_summary or '(none yet)'}\n\n"
+        f"New messages:\n{new_messages}"
     )
 
-    result = json.loads(response.choices[0].message.content or '{"title": "Untitled Conversation"}')
-    return result.get("title", "Untitled Conversation")
\ No newline at end of file
+async def summarize_conversation(previous_summary: Optional[str], new_messages: str) -> Optional[str]:
+    """Fold new transcript lines into a running summary; None if no provider or slot is available"""
+    with tracer.start_as_current_span("ai.summarize"):
+        return await _summarize_conversation(previous_summary, new_messages)
+
+async def _summarize_conversation(previous_summary: Optional[str], new_messages: str) -> Optional[str]:
+    try:
+        async with llm_scheduler.slot(None, Priority.BACKGROUND):
+            result = await llm_router.complete(
+                LLMRequest(
+                    task="summary",
+                    system=SUMMARY_SYSTEM_PROMPT,
+                    tail=_build_summary_message(previous_summary, new_messages)
+                ),
+                hedge=False
+            )
+    except (ProviderUnavailableError, SchedulerOverloadedError) as error:
+        print(f"Skipping summary refresh: {error}")
+        return None
+    return result.text.strip()
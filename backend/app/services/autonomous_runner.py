@@ -0,0 +1,129 @@
+from dataclasses import dataclass
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Set
+
+from ..database import release_connection
+from ..models.conversation import Conversation
+from ..models.character import Character
+from ..models.message import Message
+from .ai_service import stream_character_response
+from .llm import Priority
+from .conversation_service import DEFAULT_USER_PROMPT, load_context, save_character_message, message_payload
+
+# Conversations with a run in progress in this process
+_active_runs: Set[int] = set()
+
+@dataclass
+class Speaker:
+    id: int
+    name: str
+    personality: str
+
+@dataclass
+class RunEvent:
+    event: str
+    data: dict
+
+def is_running(conversation_id: int) -> bool:
+    return conversation_id in _active_runs
+
+async def _conversation_prompt(db: AsyncSession, conversation: Conversation) -> str:
+    """Latest user prompt, falling back to the same default as interactive turns"""
+    latest_prompt = await db.scalar(select(Message.content).where(
+        Message.conversation_id == conversation.id,
+        Message.is_user_prompt == True
+    ).order_by(Message.turn_number.desc()).limit(1))
+    return latest_prompt or DEFAULT_USER_PROMPT
+
+async def _load_speakers(db: AsyncSession, conversation: Conversation) -> List[Speaker]:
+    characters = (await db.scalars(select(Character).where(Character.id.in_(conversation.participant_ids)))).all()
+    by_id = {c.id: Speaker(c.id, c.name, c.personality) for c in characters}
+    # Keep the conversation's own participant order for round-robin
+    return [by_id[cid] for cid in conversation.participant_ids if cid in by_id]
+
+async def run_conversation(
+    db: AsyncSession,
+    conversation: Conversation,
+    max_turns: int,
+    user_prompt: Optional[str] = None,
+    stop_when_done: bool = True,
+    is_disconnected: Callable[[], Awaitable[bool]] = None
+) -> AsyncIterator[RunEvent]:
+    """
+    Run up to `max_turns` character turns for a conversation in one job.
+
+    Speakers rotate round-robin by `current_turn`, as the frontend does.
+    History comes from the transcript cache, which every saved turn appends
+    to, so each turn costs one provider call, one insert and a couple of
+    single-row lookups; prompts added from another tab mid-run are picked up
+    on the next turn. The run stops early when a character sets
+    shouldContinue to false (unless `stop_when_done` is off), when the client
+    disconnects, or when `is_autonomous` is switched off on the conversation.
+    Turns are scheduled as background work, so interactive requests are
+    served first when generation slots are scarce.
+    """
+    conversation_id = conversation.id
+    _active_runs.add(conversation_id)
+    turns = 0
+    reason = "max_turns"
+    try:
+        speakers = await _load_speakers(db, conversation)
+        if not speakers:
+            yield RunEvent("done", {"turns": 0, "reason": "no_participants"})
+            return
+
+        prompt = user_prompt or await _conversation_prompt(db, conversation)
+        speaker_index = conversation.current_turn
+
+        conversation.is_autonomous = True
+        await db.commit()
+
+        while turns < max_turns:
+            if is_disconnected and await is_disconnected():
+                reason = "disconnected"
+                break
+            # Single-column refresh so a PUT from another tab can stop the run
+            await db.refresh(conversation, attribute_names=["is_autonomous"])
+            if not conversation.is_autonomous:
+                reason = "stopped"
+                break
+
+            speaker = speakers[speaker_index % len(speakers)]
+            context, next_turn = await load_context(db, conversation)
+            # Nothing holds a connection while the turn streams
+            await release_connection(db)
+            yield RunEvent("turn", {"character_id": speaker.id, "turn_number": next_turn})
+
+            stream = await stream_character_response(
+                speaker.name,
+                speaker.personality,
+                context,
+                prompt,
+                user_key=conversation.user_id,
+                priority=Priority.BACKGROUND
+            )
+            async for delta in stream:
+                yield RunEvent("token", {"character_id": speaker.id, "content": delta})
+
+            message = await save_character_message(db, conversation, speaker.id, stream.result.content, speaker.name)
+            turns += 1
+            speaker_index = message.turn_number
+
+            yield RunEvent("message", {
+                "message": message_payload(message),
+                "should_continue": stream.result.should_continue
+            })
+
+            if stop_when_done and not stream.result.should_continue:
+                reason = "finished"
+                break
+
+        yield RunEvent("done", {"turns": turns, "reason": reason})
+    finally:
+        _active_runs.discard(conversation_id)
+        try:
+            conversation.is_autonomous = False
+            await db.commit()
+        except Exception:
+            await db.rollback()
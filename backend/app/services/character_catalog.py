@@ -0,0 +1,86 @@
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from ..config import settings
+from ..models.character import Character
+from ..schemas.character import CharacterResponse
+
+@dataclass
+class CatalogSlice:
+    """Pre-serialized characters: a JSON array body without brackets, and its hash"""
+    items: str
+    digest: str
+    expires_at: float
+
+class CharacterCatalog:
+    """
+    Pre-serialized character catalog.
+
+    Built-in and public characters form one slice shared by every user; each
+    user's private characters form a small slice of their own. A request
+    joins the two, and the ETag is derived from the slices' content hashes,
+    so it is identical across workers for the same data. Character writes
+    invalidate; the TTL bounds staleness for writes handled by other workers.
+    """
+
+    def __init__(self, max_users: int, ttl: float):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._shared: Optional[CatalogSlice] = None
+        self._private: "OrderedDict[int, CatalogSlice]" = OrderedDict()
+
+    def _slice(self, characters: List[Character]) -> CatalogSlice:
+        items = ",".join(CharacterResponse.model_validate(c).model_dump_json() for c in characters)
+        return CatalogSlice(
+            items=items,
+            digest=hashlib.sha256(items.encode()).hexdigest()[:16],
+            expires_at=time.monotonic() + self.ttl
+        )
+
+    async def _load(self, db: AsyncSession, *criteria) -> CatalogSlice:
+        characters = (await db.scalars(
+            select(Character).options(joinedload(Character.created_by)).where(*criteria).order_by(Character.id)
+        )).all()
+        return self._slice(characters)
+
+    async def _shared_slice(self, db: AsyncSession) -> CatalogSlice:
+        if self._shared is None or self._shared.expires_at < time.monotonic():
+            self._shared = await self._load(db, (Character.created_by_id == None) | (Character.is_public == True))
+        return self._shared
+
+    async def _private_slice(self, db: AsyncSession, user_id: int) -> CatalogSlice:
+        private = self._private.get(user_id)
+        if private is None or private.expires_at < time.monotonic():
+            private = await self._load(db, Character.created_by_id == user_id, Character.is_public == False)
+            self._private[user_id] = private
+            while len(self._private) > self.max_users:
+                self._private.popitem(last=False)
+        self._private.move_to_end(user_id)
+        return private
+
+    async def get(self, db: AsyncSession, user_id: Optional[int]) -> Tuple[str, str]:
+        """(JSON body, ETag) of the characters visible to `user_id` (None: anonymous)"""
+        slices = [await self._shared_slice(db)]
+        if user_id is not None:
+            slices.append(await self._private_slice(db, user_id))
+        body = "[" + ",".join(s.items for s in slices if s.items) + "]"
+        return body, '"' + "-".join(s.digest for s in slices) + '"'
+
+    def invalidate(self, user_id: Optional[int] = None):
+        """Drop the shared slice, and `user_id`'s private one"""
+        self._shared = None
+        if user_id is not None:
+            self._private.pop(user_id, None)
+
+    def clear(self):
+        self._shared = None
+        self._private.clear()
+
+character_catalog = CharacterCatalog(settings.CHARACTER_CATALOG_USERS, settings.CHARACTER_CATALOG_TTL)
@@ -0,0 +1,113 @@
+import asyncio
+import math
+from sqlalchemy import update
+from typing import List, Optional, Set, Tuple
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models.conversation import Conversation
+from .ai_service import summarize_conversation
+
+# Rough token estimate; avoids a tokenizer dependency and errs on the
+# generous side for English prose
+CHARS_PER_TOKEN = 4
+
+SUMMARY_HEADER = "Summary of the earlier conversation:"
+RECENT_HEADER = "Most recent messages:"
+
+# Conversations with a summary refresh in flight, and the tasks themselves
+# (held so they are not garbage collected before finishing)
+_pending: Set[int] = set()
+_tasks: Set[asyncio.Task] = set()
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def window_lines(
+    summary: Optional[str],
+    summary_turn: int,
+    entries: List[Tuple[int, str]]
+) -> List[str]:
+    """
+    Select the prompt context for the next turn within CONTEXT_MAX_TOKENS.
+
+    Turns already folded into the running summary are replaced by it; of the
+    remaining turns the newest are kept verbatim until the budget runs out.
+    Turns dropped here are folded into the summary by the next refresh.
+    """
+    budget = settings.CONTEXT_MAX_TOKENS
+    if summary:
+        budget -= estimate_tokens(SUMMARY_HEADER) + estimate_tokens(summary) + estimate_tokens(RECENT_HEADER)
+
+    kept: List[str] = []
+    for turn_number, line in reversed(entries):
+        if turn_number <= summary_turn:
+            break
+        cost = estimate_tokens(line) + 1
+        # Always keep the newest line, even if it alone exceeds the budget
+        if kept and cost > budget:
+            break
+        kept.append(line)
+        budget -= cost
+    kept.reverse()
+
+    if not summary:
+        return kept
+    return [SUMMARY_HEADER, summary, "", RECENT_HEADER] + kept
+
+def schedule_summary_refresh(
+    conversation_id: int,
+    summary: Optional[str],
+    summary_turn: int,
+    entries: List[Tuple[int, str]]
+):
+    """
+    Fold older turns into the running summary in the background.
+
+    Runs once more than CONTEXT_KEEP_TURNS + CONTEXT_SUMMARY_BATCH turns are
+    unsummarized, folding everything except the last CONTEXT_KEEP_TURNS, so
+    the summary changes once per batch rather than on every turn.
+    """
+    unsummarized = [entry for entry in entries if entry[0] > summary_turn]
+    if len(unsummarized) <= settings.CONTEXT_KEEP_TURNS + settings.CONTEXT_SUMMARY_BATCH:
+        return
+    if conversation_id in _pending:
+        return
+
+    to_fold = unsummarized[:len(unsummarized) - settings.CONTEXT_KEEP_TURNS]
+    _pending.add(conversation_id)
+    task = asyncio.create_task(_refresh_summary(conversation_id, summary, summary_turn, to_fold))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+async def _refresh_summary(
+    conversation_id: int,
+    summary: Optional[str],
+    summary_turn: int,
+    to_fold: List[Tuple[int, str]]
+):
+    try:
+        new_summary = await summarize_conversation(summary, "\n".join(line for _, line in to_fold))
+        if not new_summary:
+            return
+
+        async with AsyncSessionLocal() as db:
+            # Only apply on top of the summary we started from
+            await db.execute(
+                update(Conversation)
+                .where(
+                    Conversation.id == conversation_id,
+                    Conversation.summary_turn == summary_turn
+                )
+                .values({
+                    Conversation.summary: new_summary,
+                    Conversation.summary_turn: to_fold[-1][0],
+                    Conversation.updated_at: Conversation.updated_at
+                })
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+    except Exception as e:
+        print(f"Error refreshing summary for conversation {conversation_id}: {str(e)}")
+    finally:
+        _pending.discard(conversation_id)
@@ -0,0 +1,199 @@
+from sqlalchemy import case, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+from typing import List, Optional, Tuple
+
+from ..models.conversation import Conversation
+from ..models.message import Message
+from ..schemas.message import ConversationMessageResponse
+from .transcript_cache import transcript_cache
+from .events import publish_event, MESSAGE_CREATED, TURN_ADVANCED
+from .context_window import window_lines, schedule_summary_refresh
+from .ai_service import EMPTY_HISTORY
+
+DEFAULT_USER_PROMPT = "Please introduce yourself and share your thoughts on education."
+
+def transcript_line(message: Message, speaker_name: str = None) -> str:
+    """Render one message the way it appears in prompt context"""
+    if message.is_user_prompt:
+        return f"User: {message.content}"
+    return f"{speaker_name}: {message.content}"
+
+def format_history(lines: List[str]) -> str:
+    return "\n".join(lines) or EMPTY_HISTORY
+
+def _transcript_entries(messages: List[Message]) -> List[Tuple[int, str]]:
+    entries = []
+    for msg in messages:
+        if msg.is_user_prompt:
+            entries.append((msg.turn_number, transcript_line(msg)))
+        elif msg.character:
+            entries.append((msg.turn_number, transcript_line(msg, msg.character.name)))
+    return entries
+
+async def _messages_after(db: AsyncSession, conversation_id: int, turn_number: int) -> List[Message]:
+    return (await db.scalars(select(Message).options(joinedload(Message.character)).where(
+        Message.conversation_id == conversation_id,
+        Message.turn_number > turn_number
+    ).order_by(Message.turn_number, Message.id))).all()
+
+async def load_transcript(db: AsyncSession, conversation_id: int) -> Tuple[List[Tuple[int, str]], int]:
+    """
+    Return the (turn_number, line) transcript entries and the next turn number.
+    
+    Served from the transcript cache: a warm conversation costs a single
+    max(turn_number) lookup, plus a delta query if another writer (or worker)
+    added messages since the cache was filled.
+    """
+    last_turn = await db.scalar(select(func.max(Message.turn_number)).where(
+        Message.conversation_id == conversation_id
+    )) or 0
+    
+    transcript = transcript_cache.get(conversation_id)
+    if transcript is not None and transcript.last_turn > last_turn:
+        # History was rewritten underneath us
+        transcript = None
+    
+    if transcript is None:
+        transcript = transcript_cache.put(
+            conversation_id, _transcript_entries(await _messages_after(db, conversation_id, 0))
+        )
+    elif transcript.last_turn < last_turn:
+        transcript.entries.extend(_transcript_entries(await _messages_after(db, conversation_id, transcript.last_turn)))
+        transcript.last_turn = last_turn
+    
+    return list(transcript.entries), last_turn + 1
+
+async def load_context(db: AsyncSession, conversation: Conversation) -> Tuple[str, int]:
+    """
+    Return the token-budgeted prompt context for the next turn and its turn number.
+    
+    Older turns are represented by the conversation's running summary, which
+    is refreshed in the background once enough new turns have accumulated.
+    """
+    entries, next_turn = await load_transcript(db, conversation.id)
+    summary, summary_turn = conversation.summary, conversation.summary_turn or 0
+    schedule_summary_refresh(conversation.id, summary, summary_turn, entries)
+    return format_history(window_lines(summary, summary_turn, entries)), next_turn
+
+async def title_excerpt(db: AsyncSession, conversation_id: int) -> Optional[str]:
+    """The opening messages as title-generation input; None for an empty conversation"""
+    messages = (await db.scalars(
+        select(Message).options(joinedload(Message.character))
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.turn_number, Message.id)
+        .limit(3)
+    )).all()
+    if not messages:
+        return None
+    
+    first_messages = []
+    for msg in messages:
+        if msg.character:
+            first_messages.append(f"{msg.character.name}: {msg.content}")
+        else:
+            first_messages.append(f"User: {msg.content}")
+    return "\n".join(first_messages)
+
+def record_message(message: Message, speaker_name: Optional[str] = None):
+    """Append a freshly committed message to the cached transcript"""
+    if message.is_user_prompt:
+        transcript_cache.append(message.conversation_id, message.turn_number, transcript_line(message))
+    elif speaker_name:
+        transcript_cache.append(message.conversation_id, message.turn_number, transcript_line(message, speaker_name))
+
+async def allocate_turns(db: AsyncSession, conversation: Conversation, count: int = 1) -> int:
+    """
+    Reserve `count` consecutive turn numbers and return the first.
+    
+    A single UPDATE ... RETURNING on the conversation row: concurrent writers
+    queue on its row lock until this transaction commits, so insert the
+    messages in the same transaction. Never allocates below the newest stored
+    turn, in case current_turn was set by hand.
+    """
+    last_stored = select(func.coalesce(func.max(Message.turn_number), 0)).where(
+        Message.conversation_id == conversation.id
+    ).scalar_subquery()
+    current = case(
+        (Conversation.current_turn < last_stored, last_stored),
+        else_=Conversation.current_turn
+    )
+    last_turn = await db.scalar(
+        update(Conversation)
+        .where(Conversation.id == conversation.id)
+        .values(current_turn=current + count)
+        .returning(Conversation.current_turn)
+        .execution_options(synchronize_session=False)
+    )
+    if last_turn is None:
+        raise ValueError(f"Conversation {conversation.id} not found")
+    set_committed_value(conversation, "current_turn", last_turn)
+    return last_turn - count + 1
+
+async def save_character_message(
+    db: AsyncSession,
+    conversation: Conversation,
+    character_id: int,
+    content: str,
+    speaker_name: Optional[str] = None
+) -> Message:
+    return (await save_character_messages(db, conversation, [(character_id, content, speaker_name)]))[0]
+
+async def save_character_messages(
+    db: AsyncSession,
+    conversation: Conversation,
+    replies: List[Tuple[int, str, Optional[str]]]
+) -> List[Message]:
+    """Persist (character_id, content, speaker_name) replies in one transaction with consecutive turns"""
+    messages = await add_character_messages(db, conversation, replies)
+    await db.commit()
+    await announce_character_messages(conversation, messages, [speaker_name for _, _, speaker_name in replies])
+    return messages
+
+async def add_character_messages(
+    db: AsyncSession,
+    conversation: Conversation,
+    replies: List[Tuple[int, str, Optional[str]]]
+) -> List[Message]:
+    """Flush replies with consecutive turns into `db`'s open transaction; the caller commits"""
+    first_turn = await allocate_turns(db, conversation, len(replies))
+    messages = [
+        Message(
+            conversation_id=conversation.id,
+            character_id=character_id,
+            content=content,
+            is_user_prompt=False,
+            turn_number=first_turn + offset
+        )
+        for offset, (character_id, content, _) in enumerate(replies)
+    ]
+    db.add_all(messages)
+    
+    await db.flush()
+    for message in messages:
+        await db.refresh(message)
+    return messages
+
+async def announce_character_messages(conversation: Conversation, messages: List[Message], speaker_names: List[Optional[str]]):
+    """Cache and publish replies once add_character_messages' transaction is committed"""
+    for message, speaker_name in zip(messages, speaker_names):
+        record_message(message, speaker_name)
+    await publish_messages(conversation.id, messages)
+    await publish_event(conversation.id, TURN_ADVANCED, {"current_turn": conversation.current_turn})
+
+async def publish_messages(conversation_id: int, messages: List[Message]):
+    """Push committed messages to the conversation's live subscribers"""
+    for message in messages:
+        await publish_event(conversation_id, MESSAGE_CREATED, {
+            "message": ConversationMessageResponse.model_validate(message).model_dump(mode="json")
+        })
+
+def message_payload(message: Message) -> dict:
+    return {
+        "id": message.id,
+        "content": message.content,
+        "character_id": message.character_id,
+        "turn_number": message.turn_number,
+        "created_at": message.created_at.isoformat() if message.created_at else None
+    }
@@ -0,0 +1,92 @@
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Set
+
+# Event types pushed to conversation subscribers
+MESSAGE_CREATED = "message_created"
+TURN_ADVANCED = "turn_advanced"
+TITLE_CHANGED = "title_changed"
+JOB_UPDATED = "job_updated"
+# Sent instead of events a slow subscriber missed; the client should re-sync
+RESYNC = "resync"
+# First frame on a conversation socket once it is authenticated and subscribed
+READY = "ready"
+
+@dataclass
+class ConversationEvent:
+    conversation_id: int
+    event: str
+    data: dict = field(default_factory=dict)
+
+class EventBroker:
+    """
+    Per-conversation pub/sub.
+
+    The in-process broker below only reaches subscribers connected to the
+    same worker; when running several workers, install a broker backed by
+    Redis or Postgres LISTEN/NOTIFY with set_event_broker().
+    """
+
+    async def publish(self, event: ConversationEvent):
+        raise NotImplementedError
+
+    def subscribe(self, conversation_id: int) -> AsyncIterator[asyncio.Queue]:
+        """Async context manager yielding a queue of ConversationEvents"""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+class InProcessBroker(EventBroker):
+    def __init__(self, max_queue: int = 256):
+        self.max_queue = max_queue
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+
+    async def publish(self, event: ConversationEvent):
+        for queue in list(self._subscribers.get(event.conversation_id, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Drop the backlog rather than block publishers on a slow client
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(ConversationEvent(event.conversation_id, RESYNC))
+
+    @asynccontextmanager
+    async def subscribe(self, conversation_id: int) -> AsyncIterator[asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue)
+        self._subscribers.setdefault(conversation_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(conversation_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[conversation_id]
+
+    def subscriber_count(self, conversation_id: int) -> int:
+        return len(self._subscribers.get(conversation_id, ()))
+
+_broker: EventBroker = InProcessBroker()
+
+def set_event_broker(broker: EventBroker):
+    global _broker
+    _broker = broker
+
+def get_event_broker() -> EventBroker:
+    return _broker
+
+async def publish_event(conversation_id: int, event: str, data: dict = None):
+    """Publish after commit; delivery failures never fail the request"""
+    try:
+        await _broker.publish(ConversationEvent(conversation_id, event, data or {}))
+    except Exception as e:
+        print(f"Error publishing {event} for conversation {conversation_id}: {str(e)}")
+
+def subscribe_events(conversation_id: int):
+    return _broker.subscribe(conversation_id)
+
+async def close_event_broker():
+    await _broker.close()
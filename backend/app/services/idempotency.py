@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models.idempotency_key import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+
+# How often duplicates of a request running in another process re-check it (seconds)
+POLL_INTERVAL = 0.25
+
+# An in-progress claim lapses this long after its owner's last heartbeat,
+# so a key whose worker died can be used again
+CLAIM_LEASE = timedelta(seconds=30)
+HEARTBEAT_INTERVAL = CLAIM_LEASE.total_seconds() / 3
+
+# Requests running in this process, by (scope, key); resolved when they finish
+_inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+_last_purge = 0.0
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _fingerprint(body: Any) -> str:
+    canonical = json.dumps(jsonable_encoder(body), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+async def _claim(scope: str, key: str, fingerprint: str) -> Tuple[bool, Optional[IdempotencyKey]]:
+    """(True, None) if this request now owns the key, else (False, the stored record if any)"""
+    global _last_purge
+    now = _utcnow()
+    async with AsyncSessionLocal() as db:
+        if time.monotonic() - _last_purge > 60:
+            _last_purge = time.monotonic()
+            await db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < now))
+        else:
+            # Expired, or abandoned mid-request by a worker that died
+            await db.execute(delete(IdempotencyKey).where(
+                IdempotencyKey.scope == scope,
+                IdempotencyKey.key == key,
+                IdempotencyKey.expires_at < now
+            ))
+
+        insert = postgresql.insert if settings.is_postgresql else sqlite.insert
+        claimed = await db.execute(
+            insert(IdempotencyKey).values(
+                scope=scope,
+                key=key,
+                fingerprint=fingerprint,
+                status=IN_PROGRESS,
+                expires_at=now + CLAIM_LEASE
+            ).on_conflict_do_nothing(index_elements=["scope", "key"])
+        )
+        await db.commit()
+        if claimed.rowcount:
+            return True, None
+        return False, await db.scalar(select(IdempotencyKey).where(
+            IdempotencyKey.scope == scope,
+            IdempotencyKey.key == key
+        ))
+
+async def _heartbeat(scope: str, key: str):
+    """Keep this request's claim from lapsing while its handler runs"""
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(IdempotencyKey)
+                    .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key, IdempotencyKey.status == IN_PROGRESS)
+                    .values(expires_at=_utcnow() + CLAIM_LEASE)
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+        except Exception as e:
+            print(f"Error extending idempotency claim: {str(e)}")
+
+async def _complete(scope: str, key: str, body: Any):
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+            .values(
+                status=COMPLETED,
+                response_status=200,
+                response_body=body,
+                expires_at=_utcnow() + timedelta(seconds=settings.IDEMPOTENCY_TTL)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+async def _release(scope: str, key: str):
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(IdempotencyKey).where(
+            IdempotencyKey.scope == scope,
+            IdempotencyKey.key == key,
+            IdempotencyKey.status == IN_PROGRESS
+        ))
+        await db.commit()
+
+async def run_idempotent(
+    request: Request,
+    body: Any,
+    handler: Callable[[], Awaitable[Any]],
+    user_id: Optional[int] = None
+) -> Any:
+    """
+    Run `handler` at most once per Idempotency-Key header on this endpoint,
+    per user when the caller is authenticated (`user_id`).
+
+    `handler` returns the JSON-ready response body. A repeat with the same
+    key and body gets the stored response back (marked Idempotent-Replayed);
+    a repeat while the first is still running waits for it rather than doing
+    the work twice, and gets a 409 with Retry-After if it is still running
+    after IDEMPOTENCY_WAIT_TIMEOUT. Reusing a key with a different body is a 422. Failed
+    requests store nothing, so they can be retried with the same key.
+    Without the header, `handler` simply runs.
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return await handler()
+    if len(key) > 255:
+        raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} is too long")
+
+    scope = f"{request.method} {request.url.path}"
+    if user_id is not None:
+        # Another client reusing the key must not get this user's response
+        scope = f"{scope} user:{user_id}"
+    fingerprint = _fingerprint(body)
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+
+    while True:
+        inflight = _inflight.get((scope, key))
+        if inflight is not None:
+            # Running in this process: wait for it without touching the database
+            try:
+                await asyncio.wait_for(asyncio.shield(inflight), timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+
+        owned, stored = await _claim(scope, key, fingerprint)
+        if owned:
+            break
+        if stored is None:
+            continue  # Released between our insert and select
+        if stored.fingerprint != fingerprint:
+            raise HTTPException(status_code=422, detail=f"{IDEMPOTENCY_HEADER} was already used for a different request")
+        if stored.status == COMPLETED:
+            return JSONResponse(
+                content=stored.response_body,
+                status_code=stored.response_status or 200,
+                headers={REPLAYED_HEADER: "true"}
+            )
+        if time.monotonic() >= deadline:
+            raise HTTPException(
+                status_code=409,
+                detail=f"A request with this {IDEMPOTENCY_HEADER} is still in progress",
+                headers={"Retry-After": str(max(1, round(HEARTBEAT_INTERVAL)))}
+            )
+        if (scope, key) not in _inflight:
+            await asyncio.sleep(POLL_INTERVAL)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[(scope, key)] = future
+    heartbeat = asyncio.create_task(_heartbeat(scope, key))
+    try:
+        result = await handler()
+    except BaseException:
+        await asyncio.shield(_release(scope, key))
+        raise
+    else:
+        await _complete(scope, key, jsonable_encoder(result))
+        return result
+    finally:
+        heartbeat.cancel()
+        _inflight.pop((scope, key), None)
+        future.set_result(None)
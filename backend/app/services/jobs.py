@@ -0,0 +1,299 @@
+import asyncio
+import os
+import random
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models.character import Character
+from ..models.conversation import Conversation
+from ..models.job import Job
+from ..schemas.job import JobResponse
+from .ai_service import generate_character_response, generate_conversation_title
+from .conversation_service import (
+    DEFAULT_USER_PROMPT, load_context, add_character_messages, announce_character_messages, message_payload, title_excerpt
+)
+from .events import publish_event, JOB_UPDATED, TITLE_CHANGED
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = {SUCCEEDED, FAILED}
+
+class PermanentJobError(Exception):
+    """A failure retrying cannot fix, such as a deleted conversation"""
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+async def publish_job(job: Job):
+    await publish_event(job.conversation_id, JOB_UPDATED, {
+        "job": JobResponse.model_validate(job).model_dump(mode="json")
+    })
+
+async def enqueue_job(db: AsyncSession, kind: str, conversation_id: int, user_id: Optional[int], payload: dict) -> Job:
+    """Persist a job and wake an idle local worker; returns the committed job"""
+    job = Job(
+        kind=kind,
+        conversation_id=conversation_id,
+        user_id=user_id,
+        payload=payload,
+        status=QUEUED,
+        attempts=0,
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+        run_after=utcnow()
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    job_workers.notify()
+    await publish_job(job)
+    return job
+
+class LeaseLostError(Exception):
+    """Another worker reclaimed the job (our lease ran out); leave it to them"""
+
+async def _mark_succeeded(db: AsyncSession, job: Job, worker_id: str, result: dict):
+    """
+    Mark `job` succeeded with `result` in `db`'s open transaction, provided
+    this worker still holds its lease; raises LeaseLostError otherwise.
+    """
+    owned = await db.execute(
+        update(Job)
+        .where(Job.id == job.id, Job.status == RUNNING, Job.locked_by == worker_id)
+        .values(status=SUCCEEDED, result=result, error=None, locked_by=None, locked_until=None)
+        .execution_options(synchronize_session=False)
+    )
+    if not owned.rowcount:
+        raise LeaseLostError(f"Job {job.id} was reclaimed by another worker")
+
+# Handlers read what they need in one short session and write the result in
+# another, so no connection is held while the provider works. The job is
+# marked succeeded, with its result, in the same transaction as the work, so
+# a worker that dies right after committing a message cannot generate it
+# again on retry, and a succeeded job always carries its result.
+
+async def _run_generate_response(job: Job, worker_id: str) -> dict:
+    async with AsyncSessionLocal() as db:
+        conversation = await db.get(Conversation, job.conversation_id)
+        character = await db.get(Character, job.payload.get("character_id"))
+        if not conversation or not character:
+            raise PermanentJobError("Conversation or character not found")
+        context, _ = await load_context(db, conversation)
+
+    ai_response = await generate_character_response(
+        character.name,
+        character.personality,
+        context,
+        job.payload.get("user_prompt") or DEFAULT_USER_PROMPT,
+        user_key=conversation.user_id
+    )
+
+    async with AsyncSessionLocal() as db:
+        conversation = await db.get(Conversation, job.conversation_id)
+        if not conversation:
+            raise PermanentJobError("Conversation not found")
+        messages = await add_character_messages(db, conversation, [(character.id, ai_response.content, character.name)])
+        result = {"message": message_payload(messages[0]), "should_continue": ai_response.should_continue}
+        await _mark_succeeded(db, job, worker_id, result)
+        await db.commit()
+    await announce_character_messages(conversation, messages, [character.name])
+    return result
+
+async def _run_generate_title(job: Job, worker_id: str) -> dict:
+    async with AsyncSessionLocal() as db:
+        excerpt = await title_excerpt(db, job.conversation_id)
+        if excerpt is None:
+            raise PermanentJobError("Conversation not found or empty")
+        user_id = await db.scalar(select(Conversation.user_id).where(Conversation.id == job.conversation_id))
+
+    title = await generate_conversation_title(excerpt, user_key=user_id)
+
+    async with AsyncSessionLocal() as db:
+        conversation = await db.get(Conversation, job.conversation_id)
+        if not conversation:
+            raise PermanentJobError("Conversation not found")
+        conversation.title = title
+        await _mark_succeeded(db, job, worker_id, {"title": title})
+        await db.commit()
+    await publish_event(job.conversation_id, TITLE_CHANGED, {"title": title})
+    return {"title": title}
+
+# Handlers mark their job succeeded themselves (see _mark_succeeded)
+JOB_HANDLERS: Dict[str, Callable[[Job, str], Awaitable[dict]]] = {
+    "generate_response": _run_generate_response,
+    "generate_title": _run_generate_title,
+}
+
+def retry_delay(job: Job, error: Exception) -> float:
+    """Exponential backoff with jitter; overload and open circuits say when to come back"""
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after:
+        return float(retry_after)
+    delay = min(settings.JOB_RETRY_MAX_DELAY, settings.JOB_RETRY_BASE_DELAY * 2 ** max(0, job.attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+class JobWorkers:
+    """
+    Pool of asyncio workers claiming jobs from the jobs table.
+
+    A claim takes a lease (locked_until) that a heartbeat extends while the
+    job runs. Jobs whose lease ran out, because their worker crashed or was
+    redeployed, are claimed again, so work survives restarts; a graceful
+    shutdown hands running jobs straight back to the queue. Any number of
+    processes may run workers against the same database.
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self, count: int):
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(count)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    @property
+    def lease(self) -> timedelta:
+        return timedelta(seconds=settings.JOB_LEASE_SECONDS)
+
+    async def _work(self):
+        while True:
+            try:
+                job_id = await self._claim()
+            except Exception as e:
+                print(f"Error claiming job: {str(e)}")
+                job_id = None
+
+            if job_id is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run(job_id)
+
+    async def _claim(self) -> Optional[int]:
+        now = utcnow()
+        claimable = or_(
+            and_(Job.status == QUEUED, Job.run_after <= now),
+            # Lease ran out: the worker running it died or was redeployed
+            and_(Job.status == RUNNING, Job.locked_until < now)
+        )
+        async with AsyncSessionLocal() as db:
+            job_id = await db.scalar(
+                select(Job.id).where(claimable)
+                .order_by(Job.run_after, Job.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            if job_id is None:
+                return None
+            # Conditional update: only one worker wins a job, even without row locks (SQLite)
+            claimed = await db.execute(
+                update(Job)
+                .where(Job.id == job_id, claimable)
+                .values(
+                    status=RUNNING,
+                    attempts=Job.attempts + 1,
+                    locked_by=self.worker_id,
+                    locked_until=now + self.lease
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            return job_id if claimed.rowcount else None
+
+    async def _heartbeat(self, job_id: int):
+        while True:
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        update(Job)
+                        .where(Job.id == job_id, Job.status == RUNNING, Job.locked_by == self.worker_id)
+                        .values(locked_until=utcnow() + self.lease)
+                        .execution_options(synchronize_session=False)
+                    )
+                    await db.commit()
+            except Exception as e:
+                print(f"Error extending lease of job {job_id}: {str(e)}")
+
+    async def _release(self, job_id: int):
+        """Hand an interrupted job back to the queue without counting the attempt"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == RUNNING, Job.locked_by == self.worker_id)
+                .values(status=QUEUED, attempts=Job.attempts - 1, run_after=utcnow(), locked_by=None, locked_until=None)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+    async def _run(self, job_id: int):
+        async with AsyncSessionLocal() as db:
+            job = await db.get(Job, job_id)
+        if job is None:
+            return
+
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            handler = JOB_HANDLERS.get(job.kind)
+            if handler is None:
+                raise PermanentJobError(f"Unknown job kind: {job.kind}")
+            if job.attempts > job.max_attempts:
+                raise PermanentJobError("Interrupted too many times")
+            await handler(job, self.worker_id)
+        except asyncio.CancelledError:
+            # Shutting down: let the next worker (or this one after restart) pick it up
+            await self._release(job_id)
+            raise
+        except LeaseLostError as e:
+            print(f"Job {job_id} ({job.kind}): {str(e)}")
+            return
+        except Exception as e:
+            await self._fail(job_id, e)
+        finally:
+            heartbeat.cancel()
+
+        async with AsyncSessionLocal() as db:
+            job = await db.get(Job, job_id)
+            await publish_job(job)
+
+    async def _fail(self, job_id: int, error: Exception):
+        """Schedule a retry, or fail the job for good, unless another worker has taken it over"""
+        async with AsyncSessionLocal() as db:
+            job = await db.get(Job, job_id)
+            if job is None or job.locked_by != self.worker_id:
+                return
+            if isinstance(error, PermanentJobError) or job.attempts >= job.max_attempts:
+                print(f"Job {job_id} ({job.kind}) failed: {str(error)}")
+                job.status = FAILED
+                job.error = str(error)
+            else:
+                job.status = QUEUED
+                job.error = str(error)
+                job.run_after = utcnow() + timedelta(seconds=retry_delay(job, error))
+            job.locked_by = None
+            job.locked_until = None
+            await db.commit()
+
+job_workers = JobWorkers()
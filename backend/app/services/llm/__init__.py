@@ -0,0 +1,19 @@
+from .base import LLMProvider, LLMRequest, LLMResult, TaskConfig, close_http_client
+from .registry import register_provider, get_provider, available_providers, task_config, close_providers
+from .anthropic_provider import AnthropicProvider
+from .openai_provider import OpenAIProvider
+from .mock_provider import MockProvider
+from .router import LLMRouter, ProviderUnavailableError, llm_router
+from .scheduler import LLMScheduler, Priority, SchedulerOverloadedError, llm_scheduler
+
+register_provider(AnthropicProvider())
+register_provider(OpenAIProvider())
+register_provider(MockProvider())
+
+__all__ = [
+    "LLMProvider", "LLMRequest", "LLMResult", "TaskConfig",
+    "register_provider", "get_provider", "available_providers", "task_config",
+    "close_providers", "close_http_client",
+    "LLMRouter", "ProviderUnavailableError", "llm_router",
+    "LLMScheduler", "Priority", "SchedulerOverloadedError", "llm_scheduler"
+]
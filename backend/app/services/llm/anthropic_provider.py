@@ -0,0 +1,90 @@
+from anthropic import AsyncAnthropic
+from typing import Any, AsyncIterator, Dict, List, Optional
+from ...config import settings
+from .base import LLMProvider, LLMRequest, LLMResult, TaskConfig, http_client, record_usage, request_timeout
+
+# Anthropic only caches up to explicit breakpoints
+CACHE_CONTROL = {"type": "ephemeral"}
+
+def _usage(usage) -> Dict[str, int]:
+    return {
+        "input_tokens": usage.input_tokens or 0,
+        "output_tokens": usage.output_tokens or 0,
+        "cache_read_tokens": getattr(usage, "cache_read_input_tokens", None) or 0,
+        "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", None) or 0,
+    }
+
+def _transcript_blocks(transcript: str) -> List[Dict[str, Any]]:
+    """
+    Split the transcript into one content block per line, with a cache
+    breakpoint on the last one.
+
+    The next turn only appends lines, so its prefix up to the previous
+    breakpoint matches block for block and is read from the cache; only new
+    lines and the tail are billed in full.
+    """
+    lines = transcript.split("\n")
+    blocks: List[Dict[str, Any]] = []
+    for index, line in enumerate(lines):
+        text = line if index == len(lines) - 1 else line + "\n"
+        if blocks and not line.strip():
+            # Whitespace-only text blocks are rejected; fold into the previous one
+            blocks[-1]["text"] += text
+        else:
+            blocks.append({"type": "text", "text": text})
+    blocks[-1]["cache_control"] = CACHE_CONTROL
+    return blocks
+
+class AnthropicProvider(LLMProvider):
+    name = "anthropic"
+
+    def __init__(self):
+        self.client = None
+        if settings.ANTHROPIC_API_KEY and settings.ANTHROPIC_API_KEY not in ["sk-ant-REDACTED", "your_anthropic_key"]:
+            print(f"Initializing Anthropic client with key starting with: {settings.ANTHROPIC_API_KEY[:10]}...")
+            self.client = AsyncAnthropic(api_key=settings.ANTHROPIC_API_KEY, http_client=http_client)
+        else:
+            print(f"Anthropic key not valid: {settings.ANTHROPIC_API_KEY[:20] if settings.ANTHROPIC_API_KEY else 'None'}...")
+
+    def is_configured(self) -> bool:
+        return self.client is not None
+
+    def _arguments(self, request: LLMRequest, config: TaskConfig) -> Dict[str, Any]:
+        if request.transcript:
+            # Stable system prompt and transcript first, both cacheable
+            system = [{"type": "text", "text": request.system, "cache_control": CACHE_CONTROL}]
+            content = _transcript_blocks(request.transcript)
+            if request.tail:
+                content.append({"type": "text", "text": request.tail})
+        else:
+            system = request.system
+            content = request.tail
+        return {
+            "model": config.model,
+            "max_tokens": config.max_tokens,
+            "temperature": config.temperature,
+            "timeout": request_timeout(config.timeout),
+            "system": system,
+            "messages": [{"role": "user", "content": content}],
+        }
+
+    async def complete(self, request: LLMRequest, config: TaskConfig) -> LLMResult:
+        response = await self.client.messages.create(**self._arguments(request, config))
+        usage = _usage(response.usage)
+        record_usage(self.name, config.model, request.task, usage)
+        return LLMResult(text=response.content[0].text, provider=self.name, model=config.model, usage=usage)
+
+    async def stream(
+        self,
+        request: LLMRequest,
+        config: TaskConfig,
+        usage: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[str]:
+        async with self.client.messages.stream(**self._arguments(request, config)) as stream:
+            async for text in stream.text_stream:
+                yield text
+            final_message = await stream.get_final_message()
+
+        if usage is not None:
+            usage.update(_usage(final_message.usage))
+            record_usage(self.name, config.model, request.task, usage)
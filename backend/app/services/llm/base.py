@@ -0,0 +1,99 @@
+import logging
+import httpx
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Optional
+from ...config import settings
+from ..metrics import observe_tokens
+
+logger = logging.getLogger(__name__)
+
+# Shared, pooled HTTP transport for all provider clients. Both SDKs build
+# absolute request URLs, so a single AsyncClient (and its keep-alive pool)
+# can serve Anthropic and OpenAI calls alike.
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=settings.AI_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.AI_MAX_KEEPALIVE_CONNECTIONS,
+    ),
+    timeout=httpx.Timeout(settings.AI_REQUEST_TIMEOUT, connect=settings.AI_CONNECT_TIMEOUT),
+)
+
+def request_timeout(total: float) -> httpx.Timeout:
+    """Per-call read/write timeout with the shared connect limit"""
+    return httpx.Timeout(total, connect=settings.AI_CONNECT_TIMEOUT)
+
+@dataclass
+class TaskConfig:
+    """Model and limits a provider uses for one kind of task"""
+    model: str
+    max_tokens: int
+    temperature: float
+    timeout: float
+
+@dataclass
+class LLMRequest:
+    """
+    A provider-neutral completion request.
+
+    The user message is `transcript` followed by `tail`: the transcript is the
+    stable prefix that repeats across turns (and may be prompt-cached), the
+    tail is the per-call remainder.
+    """
+    task: str
+    system: str
+    transcript: str = ""
+    tail: str = ""
+    json_output: bool = False
+
+    @property
+    def user_message(self) -> str:
+        return self.transcript + self.tail
+
+@dataclass
+class LLMResult:
+    text: str
+    provider: str
+    model: str
+    usage: Dict[str, int] = field(default_factory=dict)
+
+def empty_usage() -> Dict[str, int]:
+    return {"input_tokens": 0, "output_tokens": 0, "cache_read_tokens": 0, "cache_write_tokens": 0}
+
+def record_usage(provider: str, model: str, task: str, usage: Dict[str, int]):
+    """Log and export per-call token usage, including prompt cache hits and writes"""
+    observe_tokens(provider, model, task, usage)
+    logger.info(
+        f"LLM usage provider={provider} model={model} task={task} input={usage['input_tokens']} "
+        f"output={usage['output_tokens']} cache_read={usage['cache_read_tokens']} "
+        f"cache_write={usage['cache_write_tokens']}"
+    )
+
+class LLMProvider:
+    """
+    Interface every LLM backend implements.
+
+    `complete` returns the whole reply; `stream` yields text deltas and fills
+    the caller's `usage` dict once the provider reports token counts.
+    """
+
+    name: str = ""
+
+    def is_configured(self) -> bool:
+        raise NotImplementedError
+
+    async def complete(self, request: LLMRequest, config: TaskConfig) -> LLMResult:
+        raise NotImplementedError
+
+    def stream(
+        self,
+        request: LLMRequest,
+        config: TaskConfig,
+        usage: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+async def close_http_client():
+    await http_client.aclose()
@@ -0,0 +1,68 @@
+import asyncio
+import json
+import re
+from typing import AsyncIterator, Dict, List, Optional
+from ...config import settings
+from .base import LLMProvider, LLMRequest, LLMResult, TaskConfig, record_usage
+
+_TOKEN = re.compile(r"\S+\s*|\s+")
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN.findall(text)
+
+class MockProvider(LLMProvider):
+    """
+    Deterministic offline provider for load tests and benchmarks.
+
+    Waits MOCK_LLM_LATENCY seconds before the first token and
+    MOCK_LLM_TOKEN_DELAY between tokens, then answers with MOCK_LLM_RESPONSE
+    in the shape each task expects. No network access or API key needed.
+    """
+
+    name = "mock"
+
+    def is_configured(self) -> bool:
+        return True
+
+    def _reply(self, request: LLMRequest) -> str:
+        if request.task == "character":
+            return json.dumps({
+                "content": settings.MOCK_LLM_RESPONSE,
+                "shouldContinue": settings.MOCK_LLM_SHOULD_CONTINUE
+            })
+        if request.task == "title":
+            return json.dumps({"title": settings.MOCK_LLM_TITLE})
+        return settings.MOCK_LLM_RESPONSE
+
+    def _usage(self, request: LLMRequest, reply: str) -> Dict[str, int]:
+        return {
+            "input_tokens": len(_tokens(request.system + request.user_message)),
+            "output_tokens": len(_tokens(reply)),
+            "cache_read_tokens": 0,
+            "cache_write_tokens": 0,
+        }
+
+    async def complete(self, request: LLMRequest, config: TaskConfig) -> LLMResult:
+        reply = self._reply(request)
+        tokens = _tokens(reply)
+        await asyncio.sleep(settings.MOCK_LLM_LATENCY + settings.MOCK_LLM_TOKEN_DELAY * len(tokens))
+        usage = self._usage(request, reply)
+        record_usage(self.name, config.model, request.task, usage)
+        return LLMResult(text=reply, provider=self.name, model=config.model, usage=usage)
+
+    async def stream(
+        self,
+        request: LLMRequest,
+        config: TaskConfig,
+        usage: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[str]:
+        reply = self._reply(request)
+        await asyncio.sleep(settings.MOCK_LLM_LATENCY)
+        for index, token in enumerate(_tokens(reply)):
+            if index and settings.MOCK_LLM_TOKEN_DELAY:
+                await asyncio.sleep(settings.MOCK_LLM_TOKEN_DELAY)
+            yield token
+
+        if usage is not None:
+            usage.update(self._usage(request, reply))
+            record_usage(self.name, config.model, request.task, usage)
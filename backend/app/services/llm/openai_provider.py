@@ -0,0 +1,84 @@
+from openai import AsyncOpenAI
+from typing import Any, AsyncIterator, Dict, Optional
+from ...config import settings
+from .base import LLMProvider, LLMRequest, LLMResult, TaskConfig, http_client, record_usage, request_timeout
+
+def _usage_field(obj, name: str):
+    # Fields the pinned SDK does not model yet arrive as plain dicts
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+def _usage(usage) -> Dict[str, int]:
+    details = _usage_field(usage, "prompt_tokens_details")
+    return {
+        "input_tokens": _usage_field(usage, "prompt_tokens") or 0,
+        "output_tokens": _usage_field(usage, "completion_tokens") or 0,
+        "cache_read_tokens": (_usage_field(details, "cached_tokens") if details else None) or 0,
+        "cache_write_tokens": 0,
+    }
+
+class OpenAIProvider(LLMProvider):
+    """
+    OpenAI chat completions.
+
+    OpenAI caches any repeated prompt prefix of 1024+ tokens automatically,
+    so keeping the system prompt and transcript ahead of the per-call tail
+    is all prompt caching needs here.
+    """
+
+    name = "openai"
+
+    def __init__(self):
+        self.client = None
+        if settings.OPENAI_API_KEY and settings.OPENAI_API_KEY not in ["sk-fake-key-for-development", "your_openai_key"]:
+            self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, http_client=http_client)
+
+    def is_configured(self) -> bool:
+        return self.client is not None
+
+    def _arguments(self, request: LLMRequest, config: TaskConfig) -> Dict[str, Any]:
+        arguments = {
+            "model": config.model,
+            "max_tokens": config.max_tokens,
+            "temperature": config.temperature,
+            "timeout": request_timeout(config.timeout),
+            "messages": [
+                {"role": "system", "content": request.system},
+                {"role": "user", "content": request.user_message}
+            ],
+        }
+        if request.json_output:
+            arguments["response_format"] = {"type": "json_object"}
+        return arguments
+
+    async def complete(self, request: LLMRequest, config: TaskConfig) -> LLMResult:
+        response = await self.client.chat.completions.create(**self._arguments(request, config))
+        usage = _usage(response.usage)
+        record_usage(self.name, config.model, request.task, usage)
+        return LLMResult(
+            text=response.choices[0].message.content or "",
+            provider=self.name,
+            model=config.model,
+            usage=usage
+        )
+
+    async def stream(
+        self,
+        request: LLMRequest,
+        config: TaskConfig,
+        usage: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(
+            **self._arguments(request, config),
+            stream=True,
+            # Final chunk carries token usage (including cached prompt tokens)
+            extra_body={"stream_options": {"include_usage": True}},
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            chunk_usage = getattr(chunk, "usage", None)
+            if chunk_usage and usage is not None:
+                usage.update(_usage(chunk_usage))
+                record_usage(self.name, config.model, request.task, usage)
@@ -0,0 +1,54 @@
+from typing import Dict, List
+from ...config import settings
+from .base import LLMProvider, TaskConfig
+
+_providers: Dict[str, LLMProvider] = {}
+
+# Built-in per-task defaults; AI_TASK_CONFIG overrides individual fields, e.g.
+# {"anthropic": {"title": {"model": "claude-3-5-haiku-20241022"}}}
+DEFAULT_TASK_CONFIGS: Dict[str, Dict[str, TaskConfig]] = {
+    "anthropic": {
+        "character": TaskConfig("claude-3-5-sonnet-20241022", 1000, 0.8, settings.AI_REQUEST_TIMEOUT),
+        "title": TaskConfig("claude-3-5-sonnet-20241022", 100, 0.7, settings.AI_TITLE_TIMEOUT),
+        "summary": TaskConfig("claude-3-5-sonnet-20241022", 500, 0.3, settings.AI_REQUEST_TIMEOUT),
+    },
+    "openai": {
+        "character": TaskConfig("gpt-4o", 1000, 0.8, settings.AI_REQUEST_TIMEOUT),
+        "title": TaskConfig("gpt-4o", 100, 0.7, settings.AI_TITLE_TIMEOUT),
+        "summary": TaskConfig("gpt-4o", 500, 0.3, settings.AI_REQUEST_TIMEOUT),
+    },
+    "mock": {
+        "character": TaskConfig("mock", 1000, 0.8, settings.AI_REQUEST_TIMEOUT),
+        "title": TaskConfig("mock", 100, 0.7, settings.AI_TITLE_TIMEOUT),
+        "summary": TaskConfig("mock", 500, 0.3, settings.AI_REQUEST_TIMEOUT),
+    },
+}
+
+def register_provider(provider: LLMProvider, task_configs: Dict[str, TaskConfig] = None):
+    """Make a provider selectable through AI_PROVIDER"""
+    _providers[provider.name] = provider
+    if task_configs:
+        DEFAULT_TASK_CONFIGS[provider.name] = task_configs
+
+def get_provider(name: str) -> LLMProvider:
+    provider = _providers.get(name)
+    if provider is None:
+        raise KeyError(f"Unknown AI provider '{name}'")
+    return provider
+
+def available_providers() -> List[str]:
+    return list(_providers)
+
+def task_config(provider_name: str, task: str) -> TaskConfig:
+    defaults = DEFAULT_TASK_CONFIGS[provider_name][task]
+    overrides = settings.AI_TASK_CONFIG.get(provider_name, {}).get(task, {})
+    return TaskConfig(
+        model=overrides.get("model", defaults.model),
+        max_tokens=overrides.get("max_tokens", defaults.max_tokens),
+        temperature=overrides.get("temperature", defaults.temperature),
+        timeout=overrides.get("timeout", defaults.timeout),
+    )
+
+async def close_providers():
+    for provider in _providers.values():
+        await provider.close()
@@ -0,0 +1,373 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from ...config import settings
+from ..metrics import observe_first_token, observe_llm_call
+from ..tracing import tracer
+from .base import LLMProvider, LLMRequest, LLMResult
+from .registry import get_provider, task_config
+
+logger = logging.getLogger(__name__)
+
+class ProviderUnavailableError(Exception):
+    """No provider could serve the request (all failed or circuits open)"""
+
+    def __init__(self, message: str, retry_after: float = 0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+class ProviderStats:
+    """Rolling latency and error rate over the last AI_STATS_WINDOW seconds"""
+
+    def __init__(self, window: float, max_samples: int = 500):
+        self.window = window
+        self._samples: Deque[Tuple[float, float, bool]] = deque(maxlen=max_samples)
+
+    def record(self, latency: float, ok: bool):
+        self._samples.append((time.monotonic(), latency, ok))
+
+    def _recent(self) -> List[Tuple[float, float, bool]]:
+        cutoff = time.monotonic() - self.window
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return list(self._samples)
+
+    def latencies(self) -> List[float]:
+        return [latency for _, latency, ok in self._recent() if ok]
+
+    def p50(self) -> Optional[float]:
+        return _percentile(self.latencies(), 0.5)
+
+    def p95(self) -> Optional[float]:
+        return _percentile(self.latencies(), 0.95)
+
+    def error_rate(self) -> float:
+        samples = self._recent()
+        if not samples:
+            return 0.0
+        return sum(1 for _, _, ok in samples if not ok) / len(samples)
+
+    def count(self) -> int:
+        return len(self._recent())
+
+class CircuitBreaker:
+    """
+    Per-provider breaker: opens after AI_BREAKER_FAILURES consecutive failures
+    or once the rolling error rate exceeds AI_BREAKER_ERROR_RATE, stays open
+    for AI_BREAKER_COOLDOWN seconds, then lets a single trial call through.
+    """
+
+    def __init__(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def retry_after(self) -> float:
+        if self.state != "open":
+            return 0.0
+        return max(0.0, self.opened_at + settings.AI_BREAKER_COOLDOWN - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == "open" and self.retry_after() == 0:
+            self.state = "half_open"
+            self._trial_in_flight = False
+        if self.state == "half_open":
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+        return self.state == "closed"
+
+    def record_success(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self, stats: ProviderStats):
+        self.consecutive_failures += 1
+        too_many = self.consecutive_failures >= settings.AI_BREAKER_FAILURES
+        error_rate_high = (
+            stats.count() >= settings.AI_BREAKER_MIN_CALLS
+            and stats.error_rate() >= settings.AI_BREAKER_ERROR_RATE
+        )
+        if self.state == "half_open" or too_many or error_rate_high:
+            if self.state != "open":
+                logger.warning(f"Circuit opened after {self.consecutive_failures} consecutive failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def release(self):
+        """A call admitted by allow() ended without a verdict (e.g. cancelled)"""
+        self._trial_in_flight = False
+
+class LLMRouter:
+    """
+    Routes requests across the primary provider (AI_PROVIDER) and the
+    fallbacks in AI_FALLBACK_PROVIDERS.
+
+    Interactive calls are hedged: if the current provider has not answered
+    (or, when streaming, produced a first token) within the hedge delay, the
+    next healthy provider is started as well and whichever succeeds first
+    wins; the loser is cancelled. Failures fail over immediately, and
+    providers with an open circuit are skipped until their cooldown ends.
+    """
+
+    def __init__(self):
+        self._stats: Dict[Tuple[str, str], ProviderStats] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def stats(self, provider_name: str, kind: str) -> ProviderStats:
+        key = (provider_name, kind)
+        if key not in self._stats:
+            self._stats[key] = ProviderStats(settings.AI_STATS_WINDOW)
+        return self._stats[key]
+
+    def breaker(self, provider_name: str) -> CircuitBreaker:
+        if provider_name not in self._breakers:
+            self._breakers[provider_name] = CircuitBreaker()
+        return self._breakers[provider_name]
+
+    def _candidates(self) -> List[LLMProvider]:
+        names = [settings.AI_PROVIDER] + [
+            name for name in settings.AI_FALLBACK_PROVIDERS if name != settings.AI_PROVIDER
+        ]
+        providers = []
+        for name in names:
+            try:
+                provider = get_provider(name)
+            except KeyError:
+                continue
+            if provider.is_configured():
+                providers.append(provider)
+        return providers
+
+    def _admit(self, provider: LLMProvider) -> bool:
+        return self.breaker(provider.name).allow()
+
+    def _unavailable(self, providers: List[LLMProvider], error: Optional[Exception] = None) -> ProviderUnavailableError:
+        if not providers:
+            return ProviderUnavailableError(f"AI provider '{settings.AI_PROVIDER}' not configured or API key missing")
+        retry_after = min(self.breaker(p.name).retry_after() for p in providers)
+        detail = f": {error}" if error else " (circuit open)"
+        return ProviderUnavailableError(f"No AI provider available{detail}", retry_after=retry_after)
+
+    def hedge_delay(self, provider_name: str, kind: str) -> float:
+        """Fixed AI_HEDGE_DELAY if set, otherwise the provider's rolling p95"""
+        if settings.AI_HEDGE_DELAY > 0:
+            return settings.AI_HEDGE_DELAY
+        stats = self.stats(provider_name, kind)
+        if stats.count() < settings.AI_BREAKER_MIN_CALLS:
+            return settings.AI_HEDGE_DEFAULT_DELAY
+        return max(settings.AI_HEDGE_MIN_DELAY, stats.p95() or settings.AI_HEDGE_DEFAULT_DELAY)
+
+    def _record(self, provider_name: str, kind: str, started: float, error: Optional[BaseException]):
+        if isinstance(error, asyncio.CancelledError):
+            self.breaker(provider_name).release()
+            return
+        stats = self.stats(provider_name, kind)
+        stats.record(time.monotonic() - started, error is None)
+        if error is None:
+            self.breaker(provider_name).record_success()
+        else:
+            logger.warning(f"LLM call to {provider_name} failed: {error}")
+            self.breaker(provider_name).record_failure(stats)
+
+    def _observe(self, provider: LLMProvider, request: LLMRequest, kind: str, started: float, error: Optional[BaseException]):
+        """Export a finished call to /metrics; cancelled hedges are neither latency samples nor errors"""
+        if not isinstance(error, asyncio.CancelledError):
+            model = task_config(provider.name, request.task).model
+            observe_llm_call(provider.name, model, request.task, kind, time.monotonic() - started, error)
+
+    async def _timed_complete(self, provider: LLMProvider, request: LLMRequest) -> LLMResult:
+        started = time.monotonic()
+        config = task_config(provider.name, request.task)
+        try:
+            with tracer.start_as_current_span("llm.complete") as span:
+                span.set_attribute("llm.provider", provider.name)
+                span.set_attribute("llm.model", config.model)
+                span.set_attribute("llm.task", request.task)
+                result = await provider.complete(request, config)
+                for kind, count in result.usage.items():
+                    span.set_attribute(f"llm.usage.{kind}", count)
+        except BaseException as error:
+            self._record(provider.name, "complete", started, error)
+            self._observe(provider, request, "complete", started, error)
+            raise
+        self._record(provider.name, "complete", started, None)
+        self._observe(provider, request, "complete", started, None)
+        return result
+
+    async def complete(self, request: LLMRequest, hedge: bool = True) -> LLMResult:
+        providers = self._candidates()
+        queue = list(providers)
+        running: Dict[asyncio.Task, LLMProvider] = {}
+        last_error: Optional[Exception] = None
+
+        def start_next() -> bool:
+            while queue:
+                provider = queue.pop(0)
+                if self._admit(provider):
+                    running[asyncio.create_task(self._timed_complete(provider, request))] = provider
+                    return True
+            return False
+
+        if not start_next():
+            raise self._unavailable(providers)
+
+        try:
+            while running:
+                newest = list(running.values())[-1]
+                timeout = self.hedge_delay(newest.name, "complete") if hedge and queue else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Hedge: the current attempt is slow, race the next provider
+                    start_next()
+                    continue
+                for task in done:
+                    running.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                # Fail over right away instead of waiting out the hedge delay
+                start_next()
+            raise self._unavailable(providers, last_error)
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def stream(
+        self,
+        request: LLMRequest,
+        usage: Optional[Dict[str, int]] = None,
+        hedge: bool = True
+    ) -> AsyncIterator[str]:
+        """
+        Stream from the first provider to produce a token.
+
+        Hedging and failover only apply before the first token; once output
+        has started, a mid-stream error is raised to the caller.
+        """
+        providers = self._candidates()
+        queue = list(providers)
+        # first-token task -> (provider, chunk iterator, per-attempt usage, start time)
+        running: Dict[asyncio.Task, Tuple[LLMProvider, AsyncIterator[str], Dict[str, int], float]] = {}
+        last_error: Optional[Exception] = None
+        winner = None
+
+        def start_next() -> bool:
+            while queue:
+                provider = queue.pop(0)
+                if self._admit(provider):
+                    attempt_usage: Dict[str, int] = {}
+                    chunks = provider.stream(request, task_config(provider.name, request.task), attempt_usage).__aiter__()
+                    task = asyncio.create_task(chunks.__anext__())
+                    running[task] = (provider, chunks, attempt_usage, time.monotonic())
+                    return True
+            return False
+
+        if not start_next():
+            raise self._unavailable(providers)
+
+        # Not made current: the generator suspends between chunks
+        span = tracer.start_span("llm.stream", attributes={"llm.task": request.task})
+        try:
+            while running and winner is None:
+                newest = list(running.values())[-1][0]
+                timeout = self.hedge_delay(newest.name, "first_token") if hedge and queue else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    start_next()
+                    continue
+                for task in done:
+                    provider, chunks, attempt_usage, started = running.pop(task)
+                    error = task.exception()
+                    if isinstance(error, StopAsyncIteration):
+                        error = None
+                    self._record(provider.name, "first_token", started, error)
+                    if error is None:
+                        span.add_event("first_token", {"llm.provider": provider.name})
+                        observe_first_token(
+                            provider.name, task_config(provider.name, request.task).model,
+                            request.task, time.monotonic() - started
+                        )
+                    else:
+                        self._observe(provider, request, "stream", started, error)
+                    if error is None and winner is None:
+                        first = None if task.exception() else task.result()
+                        winner = (provider, chunks, attempt_usage, first)
+                        continue
+                    if error is not None:
+                        last_error = error
+                    await chunks.aclose()
+                if winner is None and last_error is not None:
+                    start_next()
+        except BaseException:
+            span.end()
+            raise
+        finally:
+            for task, (provider, chunks, _, _) in running.items():
+                task.cancel()
+                try:
+                    await task
+                except BaseException:
+                    pass
+                self.breaker(provider.name).release()
+                await chunks.aclose()
+
+        if winner is None:
+            span.end()
+            raise self._unavailable(providers, last_error)
+
+        provider, chunks, attempt_usage, first = winner
+        span.set_attribute("llm.provider", provider.name)
+        span.set_attribute("llm.model", task_config(provider.name, request.task).model)
+        started = time.monotonic()
+        try:
+            if first is not None:
+                yield first
+            async for chunk in chunks:
+                yield chunk
+        except Exception as error:
+            self._record(provider.name, "complete", started, error)
+            self._observe(provider, request, "stream", started, error)
+            raise
+        else:
+            self._observe(provider, request, "stream", started, None)
+        finally:
+            await chunks.aclose()
+            if usage is not None:
+                usage.update(attempt_usage)
+            for kind, count in attempt_usage.items():
+                span.set_attribute(f"llm.usage.{kind}", count)
+            span.end()
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Rolling health per provider, for the /api/ai/config endpoint"""
+        result = {}
+        for provider in self._candidates():
+            complete = self.stats(provider.name, "complete")
+            first_token = self.stats(provider.name, "first_token")
+            result[provider.name] = {
+                "circuit": self.breaker(provider.name).state,
+                "calls": complete.count() + first_token.count(),
+                "p50_latency": complete.p50(),
+                "p95_latency": complete.p95(),
+                "p50_first_token": first_token.p50(),
+                "p95_first_token": first_token.p95(),
+                "error_rate": max(complete.error_rate(), first_token.error_rate()),
+            }
+        return result
+
+llm_router = LLMRouter()
@@ -0,0 +1,221 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager, contextmanager
+from enum import IntEnum
+from typing import AsyncIterator, Dict, Hashable, List, Optional, Tuple
+
+from ...config import settings
+from ..tracing import tracer
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # a user is waiting on this turn
+    BACKGROUND = 1   # titles, summaries, autonomous runs
+
+class SchedulerOverloadedError(Exception):
+    """The request was shed instead of queued; retry after `retry_after` seconds"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+class TokenBucket:
+    """Requests-per-minute limiter matching the provider quota"""
+
+    def __init__(self, per_minute: float, burst: int):
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, reserve: float = 0.0) -> Optional[float]:
+        """Take a token, keeping `reserve` tokens back; returns None or seconds until one is free"""
+        self._refill()
+        if self.tokens - reserve >= 1:
+            self.tokens -= 1
+            return None
+        return (1 + reserve - self.tokens) / self.rate
+
+    def refund(self):
+        """Return a token taken for a request that was then shed"""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+class Slot:
+    """A granted generation slot; release() is idempotent"""
+
+    def __init__(self, scheduler: "LLMScheduler", user_key: Optional[Hashable]):
+        self._scheduler = scheduler
+        self._user_key = user_key
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._scheduler._release(self._user_key)
+
+class LLMScheduler:
+    """
+    Admission control in front of the provider router.
+
+    - At most AI_MAX_CONCURRENT_GENERATIONS calls run at once; the rest wait
+      in a priority queue where interactive turns always go first.
+    - Each user may have AI_MAX_CONCURRENT_PER_USER calls running or queued;
+      beyond that requests are rejected rather than queued.
+    - A token bucket (AI_RATE_LIMIT_PER_MINUTE, AI_RATE_LIMIT_BURST) keeps us
+      under the provider quota, holding AI_RATE_LIMIT_INTERACTIVE_RESERVE of
+      the bucket back from background work.
+
+    Anything that cannot start within its priority's queue timeout, or
+    arrives when the queue is full, fails fast with SchedulerOverloadedError
+    so the API can answer 429 with Retry-After instead of timing out. Shed
+    requests give back their rate-limit token, so overload does not drain
+    the bucket.
+    """
+
+    def __init__(self):
+        self.active = 0
+        self._per_user: Dict[Hashable, int] = {}
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._bucket: Optional[TokenBucket] = None
+        if settings.AI_RATE_LIMIT_PER_MINUTE > 0:
+            self._bucket = TokenBucket(settings.AI_RATE_LIMIT_PER_MINUTE, settings.AI_RATE_LIMIT_BURST)
+
+    def _queue_timeout(self, priority: Priority) -> float:
+        if priority == Priority.INTERACTIVE:
+            return settings.AI_QUEUE_TIMEOUT_INTERACTIVE
+        return settings.AI_QUEUE_TIMEOUT_BACKGROUND
+
+    def queued(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, user_key: Optional[Hashable] = None, priority: Priority = Priority.INTERACTIVE) -> Slot:
+        if user_key is not None and self._per_user.get(user_key, 0) >= settings.AI_MAX_CONCURRENT_PER_USER:
+            raise SchedulerOverloadedError("Too many generations in progress for this user", retry_after=1)
+
+        # Count queued requests against the user too, so one user cannot fill the queue
+        self._add_user(user_key, 1)
+        try:
+            with tracer.start_as_current_span("llm.scheduler_wait") as span:
+                span.set_attribute("llm.priority", priority.name)
+                await self._admit(priority)
+        except BaseException:
+            self._add_user(user_key, -1)
+            raise
+        return Slot(self, user_key)
+
+    def _add_user(self, user_key: Optional[Hashable], delta: int):
+        if user_key is None:
+            return
+        count = self._per_user.get(user_key, 0) + delta
+        if count > 0:
+            self._per_user[user_key] = count
+        else:
+            self._per_user.pop(user_key, None)
+
+    def _queue_full(self) -> bool:
+        return self.queued() >= settings.AI_MAX_QUEUED_GENERATIONS
+
+    async def _admit(self, priority: Priority):
+        # Shed before charging the rate limit, so rejected requests cost no tokens
+        if self._must_queue() and self._queue_full():
+            raise SchedulerOverloadedError("AI generation queue is full", retry_after=self._queue_timeout(priority))
+        charged = await self._take_token(priority)
+        try:
+            await self._take_slot(priority)
+        except BaseException:
+            if charged:
+                self._bucket.refund()
+            raise
+
+    async def _take_token(self, priority: Priority) -> bool:
+        """Charge the rate limit; returns whether a token was taken"""
+        if self._bucket is None:
+            return False
+        reserve = 0.0
+        if priority == Priority.BACKGROUND:
+            reserve = self._bucket.capacity * settings.AI_RATE_LIMIT_INTERACTIVE_RESERVE
+        wait = self._bucket.try_take(reserve)
+        if wait is not None:
+            if priority == Priority.INTERACTIVE or wait > self._queue_timeout(priority):
+                raise SchedulerOverloadedError("AI rate limit reached", retry_after=wait)
+            await asyncio.sleep(wait)
+            if self._bucket.try_take(reserve) is not None:
+                raise SchedulerOverloadedError("AI rate limit reached", retry_after=wait)
+        return True
+
+    def _must_queue(self) -> bool:
+        return self.active >= settings.AI_MAX_CONCURRENT_GENERATIONS or self.queued() > 0
+
+    async def _take_slot(self, priority: Priority):
+        if self._must_queue():
+            if self._queue_full():
+                raise SchedulerOverloadedError("AI generation queue is full", retry_after=self._queue_timeout(priority))
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (int(priority), next(self._sequence), future))
+            try:
+                # The slot is handed over by _release(); active already counts us
+                await asyncio.wait_for(future, timeout=self._queue_timeout(priority))
+            except BaseException as error:
+                if future.done() and not future.cancelled():
+                    # Handed a slot just as we gave up; pass it on
+                    self._release(None)
+                if isinstance(error, asyncio.TimeoutError):
+                    raise SchedulerOverloadedError("AI generation queue is busy", retry_after=self._queue_timeout(priority))
+                raise
+        else:
+            self.active += 1
+
+    def _release(self, user_key: Optional[Hashable]):
+        self._add_user(user_key, -1)
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Hand the slot straight to the next waiter
+                future.set_result(True)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        user_key: Optional[Hashable] = None,
+        priority: Priority = Priority.INTERACTIVE
+    ) -> AsyncIterator[Slot]:
+        granted = await self.acquire(user_key, priority)
+        try:
+            yield granted
+        finally:
+            granted.release()
+
+    @contextmanager
+    def user_reservation(self, user_key: Optional[Hashable], count: int):
+        """
+        Count `count` calls against `user_key` at once, for fan-out work whose
+        calls then take their slots with user_key=None. Raises
+        SchedulerOverloadedError unless all of them fit under the user's limit.
+        """
+        if user_key is not None and self._per_user.get(user_key, 0) + count > settings.AI_MAX_CONCURRENT_PER_USER:
+            raise SchedulerOverloadedError("Too many generations in progress for this user", retry_after=1)
+        self._add_user(user_key, count)
+        try:
+            yield
+        finally:
+            self._add_user(user_key, -count)
+
+    def snapshot(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": self.queued(),
+            "users_active": len(self._per_user),
+            "rate_tokens": round(self._bucket.tokens, 2) if self._bucket else None,
+        }
+
+llm_scheduler = LLMScheduler()
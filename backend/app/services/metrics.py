@@ -0,0 +1,150 @@
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "chatlab_http_request_duration_seconds",
+    "Time until the response starts (for streams: until the first byte), by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+HTTP_REQUEST_QUERIES = Histogram(
+    "chatlab_http_request_db_queries",
+    "SQL statements executed per request",
+    ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+)
+HTTP_REQUEST_DB_TIME = Histogram(
+    "chatlab_http_request_db_seconds",
+    "Time spent executing SQL per request",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS
+)
+
+DB_QUERY_DURATION = Histogram(
+    "chatlab_db_query_duration_seconds",
+    "SQL statement execution time",
+    buckets=LATENCY_BUCKETS
+)
+DB_POOL_CHECKOUTS = Counter("chatlab_db_pool_checkouts_total", "Connections checked out of the pool")
+DB_POOL_WAIT = Histogram(
+    "chatlab_db_pool_wait_seconds",
+    "Time to obtain a pooled connection, including opening a new one",
+    buckets=LATENCY_BUCKETS
+)
+DB_POOL_CHECKED_OUT = Gauge("chatlab_db_pool_checked_out", "Connections currently checked out")
+DB_POOL_SIZE = Gauge("chatlab_db_pool_size", "Configured pool size (0 for pools without one)")
+
+LLM_CALL_DURATION = Histogram(
+    "chatlab_llm_call_duration_seconds",
+    "Provider call latency (complete: whole call; stream: first token to last)",
+    ["provider", "model", "task", "kind"],
+    buckets=LLM_BUCKETS
+)
+LLM_FIRST_TOKEN = Histogram(
+    "chatlab_llm_first_token_seconds",
+    "Time to first streamed token",
+    ["provider", "model", "task"],
+    buckets=LLM_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "chatlab_llm_tokens_total",
+    "Tokens reported by providers",
+    ["provider", "model", "task", "type"]
+)
+LLM_ERRORS = Counter(
+    "chatlab_llm_errors_total",
+    "Failed provider calls",
+    ["provider", "model", "task", "error"]
+)
+
+@dataclass
+class QueryStats:
+    """SQL executed on behalf of one request"""
+    count: int = 0
+    seconds: float = 0.0
+
+# Set by the request middleware; statements add to it in place, so queries
+# from tasks spawned by the request are counted as well
+_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+def start_request_stats() -> QueryStats:
+    stats = QueryStats()
+    _query_stats.set(stats)
+    return stats
+
+def route_template(request) -> str:
+    """The matched route's path template (e.g. /api/conversations/{conversation_id}), so IDs don't become labels"""
+    partial = None
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path  # Path matched, method did not (405)
+    return partial or "unmatched"
+
+def observe_request(method: str, route: str, status: int, duration: float, stats: QueryStats):
+    HTTP_REQUEST_DURATION.labels(method, route, str(status)).observe(duration)
+    HTTP_REQUEST_QUERIES.labels(method, route).observe(stats.count)
+    HTTP_REQUEST_DB_TIME.labels(method, route).observe(stats.seconds)
+
+def instrument_engine(engine: Engine):
+    """Time statements and pool checkouts of `engine` (for async engines, pass .sync_engine)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        DB_QUERY_DURATION.observe(elapsed)
+        stats = _query_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+    pool = engine.pool
+    connect = pool.connect
+
+    # Pools have no event before a checkout starts, so time the call itself
+    def timed_connect():
+        started = time.perf_counter()
+        connection = connect()
+        DB_POOL_WAIT.observe(time.perf_counter() - started)
+        DB_POOL_CHECKOUTS.inc()
+        return connection
+
+    pool.connect = timed_connect
+    DB_POOL_CHECKED_OUT.set_function(lambda: pool.checkedout() if hasattr(pool, "checkedout") else 0)
+    DB_POOL_SIZE.set_function(lambda: pool.size() if hasattr(pool, "size") else 0)
+
+def observe_llm_call(provider: str, model: str, task: str, kind: str, duration: float, error: Optional[BaseException] = None):
+    if error is None:
+        LLM_CALL_DURATION.labels(provider, model, task, kind).observe(duration)
+    else:
+        LLM_ERRORS.labels(provider, model, task, type(error).__name__).inc()
+
+def observe_first_token(provider: str, model: str, task: str, duration: float):
+    LLM_FIRST_TOKEN.labels(provider, model, task).observe(duration)
+
+def observe_tokens(provider: str, model: str, task: str, usage: dict):
+    for kind in ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens"):
+        if usage.get(kind):
+            LLM_TOKENS.labels(provider, model, task, kind[:-len("_tokens")]).inc(usage[kind])
@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from ..config import settings
+
+# A generated opening: (content, should_continue)
+Opening = Tuple[str, bool]
+
+@dataclass
+class OpeningPool:
+    """Openings cached for one fingerprint, served round-robin"""
+    entries: List[Tuple[Opening, float]] = field(default_factory=list)
+    cursor: int = 0
+    # Generation shared by concurrent misses, and the background refill
+    pending: Optional[asyncio.Future] = None
+    refilling: bool = False
+
+def opening_fingerprint(character_name: str, character_personality: str, user_prompt: str, model: str) -> str:
+    personality = hashlib.sha256(character_personality.encode()).hexdigest()
+    return hashlib.sha256("\x00".join([character_name, personality, user_prompt or "", model]).encode()).hexdigest()
+
+class OpeningCache:
+    """
+    First turns of new conversations, keyed by opening_fingerprint().
+
+    Each key keeps up to `pool_size` different openings and rotates through
+    them. A hit starts a background generation that grows the pool, or once
+    it is full replaces the oldest opening when it is past half its TTL, so
+    hot keys stay varied and never go cold. Concurrent misses on the same key
+    share a single generation.
+    """
+
+    def __init__(self, pool_size: int, ttl: float, max_keys: int):
+        self.pool_size = pool_size
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._pools: "OrderedDict[str, OpeningPool]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.pool_size > 0 and self.ttl > 0 and self.max_keys > 0
+
+    def _pool(self, key: str) -> OpeningPool:
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = OpeningPool()
+            while len(self._pools) > self.max_keys:
+                self._pools.popitem(last=False)
+        self._pools.move_to_end(key)
+        return pool
+
+    def _add(self, pool: OpeningPool, opening: Opening, replace_oldest: bool = False):
+        if replace_oldest and pool.entries:
+            pool.entries.pop(min(range(len(pool.entries)), key=lambda i: pool.entries[i][1]))
+        pool.entries.append((opening, time.monotonic()))
+        del pool.entries[:-self.pool_size]
+
+    def take(self, key: str) -> Optional[Opening]:
+        """The next cached opening for `key`, or None"""
+        pool = self._pools.get(key)
+        if pool is None:
+            return None
+        cutoff = time.monotonic() - self.ttl
+        pool.entries = [entry for entry in pool.entries if entry[1] >= cutoff]
+        if not pool.entries:
+            return None
+        opening, _ = pool.entries[pool.cursor % len(pool.entries)]
+        pool.cursor += 1
+        self._pools.move_to_end(key)
+        return opening
+
+    def put(self, key: str, opening: Opening):
+        """Store an opening generated elsewhere (e.g. a completed stream)"""
+        if self.enabled:
+            self._add(self._pool(key), opening)
+
+    async def get(
+        self,
+        key: str,
+        generate: Callable[[], Awaitable[Opening]],
+        refill: Callable[[], Awaitable[Opening]]
+    ) -> Tuple[Opening, bool]:
+        """
+        (opening, cached) for `key`. A miss runs `generate`, or waits for the
+        miss already generating; a hit schedules `refill` in the background.
+        """
+        while True:
+            opening = self.take(key)
+            if opening is not None:
+                self.schedule_refill(key, refill)
+                return opening, True
+
+            pool = self._pool(key)
+            pending = pool.pending
+            if pending is None:
+                break
+            # Unlike awaiting the future, wait() only raises if we are cancelled
+            await asyncio.wait([pending])
+            if not pending.cancelled():
+                return pending.result(), True
+            # The request generating it was cancelled, not us: try again
+
+        pool.pending = asyncio.get_running_loop().create_future()
+        try:
+            opening = await generate()
+        except BaseException as e:
+            if not isinstance(e, asyncio.CancelledError):
+                pool.pending.set_exception(e)
+                pool.pending.exception()  # Marked retrieved: there may be no waiters
+            else:
+                pool.pending.cancel()
+            raise
+        else:
+            self._add(pool, opening)
+            pool.pending.set_result(opening)
+            return opening, False
+        finally:
+            pool.pending = None
+
+    def schedule_refill(self, key: str, refill: Callable[[], Awaitable[Opening]]):
+        """Grow `key`'s pool, or refresh its oldest opening, unless one is already underway"""
+        pool = self._pools.get(key)
+        if pool is None or pool.refilling:
+            return
+        if len(pool.entries) >= self.pool_size:
+            oldest = min(created for _, created in pool.entries)
+            if time.monotonic() - oldest < self.ttl / 2:
+                return
+        pool.refilling = True
+        task = asyncio.create_task(self._refill(key, pool, refill))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refill(self, key: str, pool: OpeningPool, refill: Callable[[], Awaitable[Opening]]):
+        try:
+            opening = await refill()
+            self._add(pool, opening, replace_oldest=len(pool.entries) >= self.pool_size)
+        except Exception as e:
+            print(f"Error refilling opening cache: {str(e)}")
+        finally:
+            pool.refilling = False
+
+    def clear(self):
+        self._pools.clear()
+
+opening_cache = OpeningCache(settings.OPENING_CACHE_POOL_SIZE, settings.OPENING_CACHE_TTL, settings.OPENING_CACHE_KEYS)
@@ -0,0 +1,85 @@
+from typing import Optional
+
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import format_trace_id
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from ..config import settings
+
+TRACE_HEADER = "X-Trace-Id"
+
+# Until configure_tracing() installs a provider, spans are no-ops
+tracer = trace.get_tracer("chatlab")
+
+_provider: Optional[TracerProvider] = None
+_file = None
+
+def configure_tracing():
+    """
+    Install the tracer provider for TRACE_EXPORTER ("file" or "otlp"; empty
+    disables tracing). TRACE_SAMPLE_RATE of new traces are recorded; requests
+    carrying a traceparent header follow the caller's sampling decision.
+    """
+    global _provider, _file
+    if not settings.TRACE_EXPORTER:
+        return
+
+    if settings.TRACE_EXPORTER == "file":
+        _file = open(settings.TRACE_FILE, "a", buffering=1)
+        exporter = ConsoleSpanExporter(out=_file, formatter=lambda span: span.to_json(indent=None) + "\n")
+    elif settings.TRACE_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        # Without TRACE_OTLP_ENDPOINT the exporter honours OTEL_EXPORTER_OTLP_* variables
+        exporter = OTLPSpanExporter(endpoint=settings.TRACE_OTLP_ENDPOINT)
+    else:
+        raise ValueError(f"Unknown TRACE_EXPORTER '{settings.TRACE_EXPORTER}'")
+
+    _provider = TracerProvider(
+        resource=Resource.create({"service.name": settings.TRACE_SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(settings.TRACE_SAMPLE_RATE))
+    )
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(_provider)
+
+def shutdown_tracing():
+    """Flush pending spans (called on application shutdown)"""
+    global _file
+    if _provider is not None:
+        _provider.shutdown()
+    if _file is not None:
+        _file.close()
+        _file = None
+
+def current_trace_id() -> Optional[str]:
+    """Hex trace id of the current span, sampled or not; None when tracing is off"""
+    context = trace.get_current_span().get_span_context()
+    return format_trace_id(context.trace_id) if context.is_valid else None
+
+def instrument_engine(engine: Engine):
+    """A span per SQL statement of `engine`, under whatever span is current"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        span = tracer.start_span("db.query")
+        if span.is_recording():
+            span.set_attribute("db.system", engine.dialect.name)
+            span.set_attribute("db.statement", statement[:500])
+        conn.info.setdefault("query_spans", []).append(span)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_spans"].pop().end()
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        spans = context.connection.info.get("query_spans") if context.connection is not None else None
+        if spans:
+            span = spans.pop()
+            span.record_exception(context.original_exception)
+            span.set_status(trace.Status(trace.StatusCode.ERROR))
+            span.end()
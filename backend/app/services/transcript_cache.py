@@ -0,0 +1,71 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from ..config import settings
+
+@dataclass
+class Transcript:
+    """Rendered prompt lines of one conversation, ordered by turn number"""
+    entries: List[Tuple[int, str]] = field(default_factory=list)
+    last_turn: int = 0
+    expires_at: float = 0.0
+
+class TranscriptCache:
+    """
+    Per-conversation transcript cache with LRU eviction and a TTL.
+
+    Writers append new messages so the next turn does not reload history;
+    anything that rewrites history (deletes, character renames) invalidates.
+    All access happens on the event loop thread, so no locking is needed.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Transcript]" = OrderedDict()
+
+    def get(self, conversation_id: int) -> Optional[Transcript]:
+        transcript = self._entries.get(conversation_id)
+        if transcript is None:
+            return None
+        if transcript.expires_at < time.monotonic():
+            del self._entries[conversation_id]
+            return None
+        self._entries.move_to_end(conversation_id)
+        return transcript
+
+    def put(self, conversation_id: int, entries: List[Tuple[int, str]]) -> Transcript:
+        transcript = Transcript(
+            entries=entries,
+            last_turn=max([turn for turn, _ in entries] + [0]),
+            expires_at=time.monotonic() + self.ttl
+        )
+        self._entries[conversation_id] = transcript
+        self._entries.move_to_end(conversation_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return transcript
+
+    def append(self, conversation_id: int, turn_number: int, line: str):
+        """Append a newly written message; out-of-order writes drop the entry instead"""
+        transcript = self._entries.get(conversation_id)
+        if transcript is None:
+            return
+        if turn_number <= transcript.last_turn:
+            self.invalidate(conversation_id)
+            return
+        transcript.entries.append((turn_number, line))
+        transcript.last_turn = turn_number
+
+    def invalidate(self, conversation_id: int):
+        self._entries.pop(conversation_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+transcript_cache = TranscriptCache(
+    max_entries=settings.TRANSCRIPT_CACHE_SIZE,
+    ttl=settings.TRANSCRIPT_CACHE_TTL
+)
@@ -86,6 +86,11 @@ def ensure_sqlite_schema():
             logger.info("Adding missing user_id column to conversations table...")
             cursor.execute("ALTER TABLE conversations ADD COLUMN user_id INTEGER")
         
+        if 'summary' not in conversations_columns:
+            logger.info("Adding missing summary columns to conversations table...")
+            cursor.execute("ALTER TABLE conversations ADD COLUMN summary TEXT")
+            cursor.execute("ALTER TABLE conversations ADD COLUMN summary_turn INTEGER NOT NULL DEFAULT 0")
+        
         # Check if characters table has required columns  
         cursor.execute("PRAGMA table_info(characters)")
         characters_columns = [row[1] for row in cursor.fetchall()]
@@ -98,6 +103,38 @@ def ensure_sqlite_schema():
             logger.info("Adding missing created_by_id column to characters table...")
             cursor.execute("ALTER TABLE characters ADD COLUMN created_by_id INTEGER")
         
+        # Unique turns per conversation (see the unique_message_turns migration)
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name = 'uq_messages_conversation_id_turn_number'")
+        if not cursor.fetchone():
+            logger.info("Enforcing unique message turns...")
+            duplicated = "SELECT conversation_id FROM messages GROUP BY conversation_id, turn_number HAVING COUNT(*) > 1"
+            cursor.execute(f"UPDATE conversations SET summary = NULL, summary_turn = 0 WHERE id IN ({duplicated})")
+            cursor.execute(f"""
+                UPDATE messages SET turn_number = (
+                    SELECT numbered.turn FROM (
+                        SELECT id, ROW_NUMBER() OVER (PARTITION BY conversation_id ORDER BY turn_number, id) AS turn
+                        FROM messages
+                    ) AS numbered
+                    WHERE numbered.id = messages.id
+                )
+                WHERE conversation_id IN ({duplicated})
+            """)
+            cursor.execute("""
+                UPDATE conversations SET current_turn = (
+                    SELECT MAX(turn_number) FROM messages WHERE messages.conversation_id = conversations.id
+                )
+                WHERE current_turn < (
+                    SELECT MAX(turn_number) FROM messages WHERE messages.conversation_id = conversations.id
+                )
+            """)
+            cursor.execute("CREATE UNIQUE INDEX uq_messages_conversation_id_turn_number ON messages (conversation_id, turn_number)")
+            cursor.execute("DROP INDEX IF EXISTS ix_messages_conversation_id_turn_number")
+        
+        # Indexes for the hot read paths (see the add_hot_path_indexes migration)
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_conversations_user_id_updated_at ON conversations (user_id, updated_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_characters_created_by_id ON characters (created_by_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_characters_is_public ON characters (is_public)")
+        
         conn.commit()
         conn.close()
         logger.info("SQLite schema verified/updated")
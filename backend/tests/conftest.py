@@ -0,0 +1,12 @@
+import os
+import tempfile
+
+# The app binds its engines to DATABASE_URL at import, so point it at a
+# throwaway SQLite file before any test imports it
+_db_dir = tempfile.mkdtemp(prefix="chatlab-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ.setdefault("SUPABASE_URL", "http://supabase.test")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ["AI_PROVIDER"] = "mock"
+os.environ["JOB_WORKERS"] = "0"
+os.environ["TRACE_EXPORTER"] = ""
@@ -0,0 +1,88 @@
+"""
+Regression guard for the conversation detail endpoint: its query count must
+not grow with the number of messages (no N+1 over messages or speakers).
+"""
+from contextlib import contextmanager
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, insert
+
+from app.main import app
+from app.auth import get_current_user
+from app.database import Base, SessionLocal, async_engine, engine
+from app.models import Character, Conversation, Message, User
+
+MESSAGE_COUNT = 1000
+# Conversation, its messages, and the participating characters
+DETAIL_QUERIES = 3
+
+@pytest.fixture(scope="module")
+def conversation_id():
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        user = User(supabase_id="detail-test", email="detail@test.example", is_active=True)
+        characters = [Character(name=f"Speaker {i}", role="Theorist", personality="Curious") for i in range(4)]
+        db.add(user)
+        db.add_all(characters)
+        db.commit()
+
+        conversation = Conversation(
+            title="Detail test",
+            participant_ids=[c.id for c in characters],
+            user_id=user.id,
+            current_turn=MESSAGE_COUNT
+        )
+        db.add(conversation)
+        db.commit()
+        db.execute(insert(Message), [
+            {
+                "conversation_id": conversation.id,
+                "character_id": None if turn % 5 == 0 else characters[turn % 4].id,
+                "content": f"Message {turn}",
+                "is_user_prompt": turn % 5 == 0,
+                "turn_number": turn
+            }
+            for turn in range(1, MESSAGE_COUNT + 1)
+        ])
+        db.commit()
+        conversation_id = conversation.id
+        db.refresh(user)
+        db.expunge(user)
+
+    app.dependency_overrides[get_current_user] = lambda: user
+    yield conversation_id
+    app.dependency_overrides.pop(get_current_user, None)
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+def test_full_history_query_count(conversation_id):
+    client = TestClient(app)
+    with count_queries() as statements:
+        response = client.get(f"/api/conversations/{conversation_id}")
+
+    assert response.status_code == 200
+    assert len(response.json()["messages"]) == MESSAGE_COUNT
+    assert len(statements) == DETAIL_QUERIES, statements
+
+def test_paged_history_query_count(conversation_id):
+    client = TestClient(app)
+    with count_queries() as statements:
+        response = client.get(f"/api/conversations/{conversation_id}", params={"limit": 50})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [m["turn_number"] for m in body["messages"]] == list(range(MESSAGE_COUNT - 49, MESSAGE_COUNT + 1))
+    assert body["next_cursor"] == MESSAGE_COUNT - 49
+    assert len(statements) == DETAIL_QUERIES, statements
@@ -12,6 +12,8 @@ interface SidebarProps {
   onNewChat: () => void
   onConversationSelect: (conversationId: number) => void
   onDeleteConversation: (conversationId: number) => void
+  hasMore?: boolean
+  onLoadMore?: () => void
 }
 
 export function Sidebar({ 
@@ -19,7 +21,9 @@ export function Sidebar({
   currentConversation, 
   onNewChat, 
   onConversationSelect, 
-  onDeleteConversation 
+  onDeleteConversation,
+  hasMore = false,
+  onLoadMore
 }: SidebarProps) {
   const { user } = useAuth()
 
@@ -94,6 +98,16 @@ export function Sidebar({
                   </div>
                 </div>
               ))}
+              {hasMore && (
+                <Button
+                  variant="ghost"
+                  size="sm"
+                  className="w-full text-gray-500"
+                  onClick={onLoadMore}
+                >
+                  Load more
+                </Button>
+              )}
             </div>
           )}
         </div>
@@ -0,0 +1,64 @@
+import { useEffect, useRef, useState } from "react";
+import { conversationSocketAuth, getConversationSocketUrl } from "@/services/api";
+import type { ConversationEvent } from "@/types/api";
+
+const MAX_RECONNECT_DELAY = 30000;
+
+// Subscribes to a conversation's live events, reconnecting with backoff.
+// `connected` tells callers whether they can skip refetching after their own writes.
+export function useConversationEvents(
+  conversationId: number | null | undefined,
+  onEvent: (event: ConversationEvent) => void
+) {
+  const [connected, setConnected] = useState(false);
+  const handler = useRef(onEvent);
+  handler.current = onEvent;
+
+  useEffect(() => {
+    if (conversationId == null) return;
+
+    let socket: WebSocket | null = null;
+    let retryTimer: ReturnType<typeof setTimeout> | undefined;
+    let attempts = 0;
+    let closed = false;
+
+    const connect = () => {
+      const current = new WebSocket(getConversationSocketUrl(conversationId));
+      socket = current;
+      current.onopen = async () => {
+        // Authenticate with the first frame; the server answers "ready" once subscribed
+        const auth = await conversationSocketAuth();
+        if (!closed && current.readyState === WebSocket.OPEN) current.send(auth);
+      };
+      current.onmessage = (message) => {
+        const event = JSON.parse(message.data) as ConversationEvent;
+        if (event.event === "ready") {
+          // Anything committed while we were away is picked up via resync
+          if (attempts > 0) handler.current({ event: "resync", data: {} });
+          attempts = 0;
+          setConnected(true);
+          return;
+        }
+        handler.current(event);
+      };
+      current.onclose = () => {
+        setConnected(false);
+        if (closed) return;
+        const delay = Math.min(MAX_RECONNECT_DELAY, 1000 * 2 ** attempts);
+        attempts += 1;
+        retryTimer = setTimeout(connect, delay);
+      };
+    };
+
+    connect();
+
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      socket?.close();
+      setConnected(false);
+    };
+  }, [conversationId]);
+
+  return { connected };
+}
@@ -1,13 +1,19 @@
-import { useQuery, useMutation, useQueryClient } from "@tanstack/react-query";
-import { get, post, del } from "@/services/api";
+import { useInfiniteQuery, useMutation, useQueryClient } from "@tanstack/react-query";
+import { getPage, post, del, idempotencyHeaders } from "@/services/api";
 import type { Conversation } from "@/types/api";
 
+const CONVERSATIONS_PAGE_SIZE = 50;
+
 export function useConversations() {
   const queryClient = useQueryClient();
 
-  const query = useQuery<Conversation[]>({
+  const query = useInfiniteQuery({
     queryKey: ["conversations"],
-    queryFn: () => get("/api/conversations/"),
+    queryFn: ({ pageParam }) => getPage<Conversation>(
+      `/api/conversations/?limit=${CONVERSATIONS_PAGE_SIZE}${pageParam ? `&cursor=${encodeURIComponent(pageParam)}` : ""}`
+    ),
+    initialPageParam: null as string | null,
+    getNextPageParam: (lastPage) => lastPage.nextCursor,
   });
 
   const createConversation = useMutation({
@@ -20,17 +26,17 @@ export function useConversations() {
   });
 
   const addUserMessage = useMutation({
-    mutationFn: async ({ conversationId, content, turnNumber }: { 
+    mutationFn: async ({ conversationId, content, idempotencyKey }: { 
       conversationId: number; 
       content: string; 
-      turnNumber: number; 
+      idempotencyKey: string;
     }) => {
+      // The server allocates the turn number
       return post(`/api/conversations/${conversationId}/messages`, {
         content,
         is_user_prompt: true,
-        turn_number: turnNumber,
         character_id: null,
-      });
+      }, idempotencyHeaders(idempotencyKey));
     },
     onSuccess: () => {
       queryClient.invalidateQueries({ queryKey: ["conversations"] });
@@ -38,15 +44,16 @@ export function useConversations() {
   });
 
   const generateResponse = useMutation({
-    mutationFn: async ({ conversationId, characterId, userPrompt }: { 
+    mutationFn: async ({ conversationId, characterId, userPrompt, idempotencyKey }: { 
       conversationId: number; 
       characterId: number; 
       userPrompt?: string; 
+      idempotencyKey: string;
     }) => {
       return post(`/api/ai/conversations/${conversationId}/generate-response`, {
         character_id: characterId,
         user_prompt: userPrompt,
-      });
+      }, idempotencyHeaders(idempotencyKey));
     },
     onSuccess: () => {
       queryClient.invalidateQueries({ queryKey: ["conversations"] });
@@ -73,6 +80,7 @@ export function useConversations() {
 
   return {
     ...query,
+    data: query.data?.pages.flatMap(page => page.items),
     createConversation,
     addUserMessage,
     generateResponse,
@@ -1,4 +1,5 @@
-import { useState } from "react";
+import { useRef, useState } from "react";
+import { useQueryClient } from "@tanstack/react-query";
 import { Button } from "@/components/ui/button";
 import { Textarea } from "@/components/ui/textarea";
 import { Plus, ArrowLeft, Send, Play, Download } from "lucide-react";
@@ -8,13 +9,17 @@ import { Sidebar } from "@/components/Sidebar";
 import { WelcomeScreen } from "@/components/WelcomeScreen";
 import { useCharacters } from "@/hooks/use-characters";
 import { useConversations } from "@/hooks/use-conversations";
+import { useConversationEvents } from "@/hooks/use-conversation-events";
 import { useAuth } from "@/context/AuthContext";
-import { get } from "@/services/api";
-import type { Character, ConversationWithMessages } from "@/types/api";
+import { getConversation, getConversationChanges, newIdempotencyKey } from "@/services/api";
+import type { Character, ConversationEvent, ConversationWithMessages } from "@/types/api";
 import ExportModal from "@/components/ExportModal";
 
 type ViewState = 'welcome' | 'selection' | 'setup' | 'discussion';
 
+// Messages loaded per page when opening a conversation or scrolling back
+const MESSAGE_PAGE_SIZE = 100;
+
 export default function Home() {
   const [isCharacterModalOpen, setIsCharacterModalOpen] = useState(false);
   const [editingCharacter, setEditingCharacter] = useState<Character | null>(null);
@@ -26,15 +31,105 @@ export default function Home() {
   const [userPrompt, setUserPrompt] = useState("");
   const [discussionTopic, setDiscussionTopic] = useState("");
 
+  // Idempotency keys of actions that have not succeeded yet, by request body:
+  // sending the same action again after a failure or timeout reuses its key,
+  // so the server replays the first attempt instead of running it twice
+  const pendingKeys = useRef(new Map<string, string>());
+  const actionKey = (action: string) => {
+    let key = pendingKeys.current.get(action);
+    if (!key) {
+      key = newIdempotencyKey();
+      pendingKeys.current.set(action, key);
+    }
+    return key;
+  };
+
   const { data: characters = [], isLoading: charactersLoading } = useCharacters();
   const { 
     data: conversations = [], 
     createConversation, 
     generateResponse, 
     addUserMessage,
-    deleteConversation
+    deleteConversation,
+    hasNextPage: hasMoreConversations,
+    fetchNextPage: fetchMoreConversations
   } = useConversations();
 
+  // Fetch only what changed since the newest loaded turn and merge it in
+  const refreshConversation = async (conversationId: number) => {
+    const loaded = currentConversation?.id === conversationId ? currentConversation.messages : [];
+    const sinceTurn = Math.max(0, ...loaded.map(m => m.turn_number));
+    const { messages, last_turn, ...fields } = await getConversationChanges(conversationId, sinceTurn);
+    setCurrentConversation(previous => {
+      if (!previous || previous.id !== conversationId) return previous;
+      const known = new Set(previous.messages.map(m => m.id));
+      return { ...previous, ...fields, messages: [...previous.messages, ...messages.filter(m => !known.has(m.id))] };
+    });
+  };
+
+  // Live updates for the open conversation; while connected, our own writes arrive here too
+  const queryClient = useQueryClient();
+  const { connected: live } = useConversationEvents(currentConversation?.id, (event: ConversationEvent) => {
+    if (!currentConversation) return;
+    const conversationId = currentConversation.id;
+    switch (event.event) {
+      case "message_created":
+        setCurrentConversation(previous => {
+          if (!previous || previous.id !== conversationId) return previous;
+          if (previous.messages.some(m => m.id === event.data.message.id)) return previous;
+          const characters = [...(previous.participants || []), ...(previous.former_participants || [])];
+          const message = {
+            ...event.data.message,
+            character: characters.find(c => c.id === event.data.message.character_id),
+          };
+          return { ...previous, messages: [...previous.messages, message] };
+        });
+        break;
+      case "turn_advanced":
+        setCurrentConversation(previous => previous && previous.id === conversationId
+          ? { ...previous, current_turn: event.data.current_turn }
+          : previous);
+        break;
+      case "title_changed":
+        setCurrentConversation(previous => previous && previous.id === conversationId
+          ? { ...previous, title: event.data.title }
+          : previous);
+        queryClient.invalidateQueries({ queryKey: ["conversations"] });
+        break;
+      case "resync":
+        refreshConversation(conversationId).catch(error => console.error("Failed to resync conversation:", error));
+        break;
+    }
+  });
+
+  const handleLoadEarlier = async () => {
+    if (currentConversation?.next_cursor == null) return;
+    try {
+      const page = await getConversation(currentConversation.id, {
+        limit: MESSAGE_PAGE_SIZE,
+        beforeTurn: currentConversation.next_cursor,
+      });
+      setCurrentConversation(previous => previous && previous.id === page.id
+        ? { ...previous, messages: [...page.messages, ...previous.messages], next_cursor: page.next_cursor }
+        : previous);
+    } catch (error) {
+      console.error("Failed to load earlier messages:", error);
+    }
+  };
+
+  const handleExport = async () => {
+    // Export needs the whole history, not just the pages loaded so far
+    if (currentConversation && currentConversation.next_cursor != null) {
+      try {
+        setCurrentConversation(await getConversation(currentConversation.id));
+      } catch (error) {
+        console.error("Failed to load conversation for export:", error);
+        return;
+      }
+    }
+    setShowExportModal(true);
+  };
+
   // All characters returned by the API are already filtered on the backend
   const availableCharacters = characters;
   const selectedCharacters = characters.filter(c => selectedCharacterIds.has(c.id));
@@ -81,7 +176,7 @@ export default function Home() {
       });
 
       // Fetch the full conversation with messages
-      const fullConversation = await get(`/api/conversations/${conversation.id}`);
+      const fullConversation = await getConversation(conversation.id, { limit: MESSAGE_PAGE_SIZE });
       setCurrentConversation(fullConversation);
       setViewState('discussion');
     } catch (error) {
@@ -96,18 +191,15 @@ export default function Home() {
       setIsGenerating(true);
       
       // Add user prompt as message
-      const nextTurn = Math.max(...(currentConversation.messages?.map(m => m.turn_number) || [0]), 0) + 1;
-      await addUserMessage.mutateAsync({
-        conversationId: currentConversation.id,
-        content: userPrompt.trim(),
-        turnNumber: nextTurn,
-      });
+      const message = { conversationId: currentConversation.id, content: userPrompt.trim() };
+      const action = JSON.stringify(["message", message]);
+      await addUserMessage.mutateAsync({ ...message, idempotencyKey: actionKey(action) });
+      pendingKeys.current.delete(action);
 
       setUserPrompt("");
       
-      // Refresh conversation
-      const updatedConversation = await get(`/api/conversations/${currentConversation.id}`);
-      setCurrentConversation(updatedConversation);
+      // Refresh conversation unless the live channel already delivered it
+      if (!live) await refreshConversation(currentConversation.id);
     } catch (error) {
       console.error("Failed to send prompt:", error);
     } finally {
@@ -142,15 +234,17 @@ export default function Home() {
         ? recentUserPrompts[0].content 
         : currentConversation.title || "Please share your thoughts on the topic being discussed.";
 
-      await generateResponse.mutateAsync({
+      const request = {
         conversationId: currentConversation.id,
         characterId: nextCharacter.id,
         userPrompt: userPrompt,
-      });
+      };
+      const action = JSON.stringify(["response", request]);
+      await generateResponse.mutateAsync({ ...request, idempotencyKey: actionKey(action) });
+      pendingKeys.current.delete(action);
 
-      // Refresh conversation
-      const updatedConversation = await get(`/api/conversations/${currentConversation.id}`);
-      setCurrentConversation(updatedConversation);
+      // Refresh conversation unless the live channel already delivered it
+      if (!live) await refreshConversation(currentConversation.id);
     } catch (error) {
       console.error("Failed to generate next turn:", error);
     } finally {
@@ -160,7 +254,7 @@ export default function Home() {
 
   const handleConversationSelect = async (conversationId: number) => {
     try {
-      const conversation = await get(`/api/conversations/${conversationId}`);
+      const conversation = await getConversation(conversationId, { limit: MESSAGE_PAGE_SIZE });
       setCurrentConversation(conversation);
       setViewState('discussion');
       
@@ -372,7 +466,7 @@ export default function Home() {
                   <Button 
                     variant="outline" 
                     size="sm"
-                    onClick={() => setShowExportModal(true)}
+                    onClick={handleExport}
                   >
                     <Download className="w-4 h-4 mr-2" />
                     Export
@@ -383,6 +477,13 @@ export default function Home() {
 
             {/* Messages */}
             <div className="flex-1 overflow-y-auto p-6 space-y-4">
+              {currentConversation.next_cursor != null && (
+                <div className="text-center">
+                  <Button variant="ghost" size="sm" onClick={handleLoadEarlier}>
+                    Load earlier messages
+                  </Button>
+                </div>
+              )}
               {currentConversation.messages
                 ?.sort((a, b) => a.turn_number - b.turn_number)
                 .map((message) => (
@@ -478,6 +579,8 @@ export default function Home() {
         onNewChat={handleNewChat}
         onConversationSelect={handleConversationSelect}
         onDeleteConversation={handleDeleteConversation}
+        hasMore={hasMoreConversations}
+        onLoadMore={() => fetchMoreConversations()}
       />
 
       {/* Main Content */}
@@ -1,4 +1,5 @@
 import { supabase } from '../lib/supabase';
+import type { Character, ConversationChanges, ConversationWithMessages, Message } from '../types/api';
 
 // Determine API base URL based on environment
 const getApiBaseUrl = () => {
@@ -16,7 +17,8 @@ const API_BASE_URL = getApiBaseUrl();
 export async function apiRequest(
   method: string,
   endpoint: string,
-  data?: unknown
+  data?: unknown,
+  extraHeaders: Record<string, string> = {}
 ): Promise<Response> {
   const url = `${API_BASE_URL}${endpoint}`;
   
@@ -25,7 +27,7 @@ export async function apiRequest(
   const accessToken = session?.access_token;
   
   
-  const headers: Record<string, string> = {};
+  const headers: Record<string, string> = { ...extraHeaders };
   
   if (data) {
     headers["Content-Type"] = "application/json";
@@ -55,11 +57,27 @@ export async function get(endpoint: string) {
   return res.json();
 }
 
-export async function post(endpoint: string, data?: unknown) {
-  const res = await apiRequest('POST', endpoint, data);
+// Keyset-paginated list: the cursor for the next page comes back in X-Next-Cursor
+export async function getPage<T>(endpoint: string): Promise<{ items: T[]; nextCursor: string | null }> {
+  const res = await apiRequest('GET', endpoint);
+  return { items: await res.json(), nextCursor: res.headers.get('X-Next-Cursor') };
+}
+
+export async function post(endpoint: string, data?: unknown, headers?: Record<string, string>) {
+  const res = await apiRequest('POST', endpoint, data, headers);
   return res.json();
 }
 
+// Makes a POST safe to retry: the server replays the first response for a repeated key.
+// Create one key per user action and send the same key on every retry of it.
+export function newIdempotencyKey(): string {
+  return crypto.randomUUID();
+}
+
+export function idempotencyHeaders(key: string): Record<string, string> {
+  return { 'Idempotency-Key': key };
+}
+
 export async function put(endpoint: string, data?: unknown) {
   const res = await apiRequest('PUT', endpoint, data);
   return res.json();
@@ -68,4 +86,48 @@ export async function put(endpoint: string, data?: unknown) {
 export async function del(endpoint: string) {
   const res = await apiRequest('DELETE', endpoint);
   return res.json();
-}
\ No newline at end of file
+}
+
+// The detail endpoint sends each character once; messages reference them by character_id.
+// With a limit only the newest messages (before beforeTurn) are loaded; next_cursor pages further back.
+export async function getConversation(
+  conversationId: number,
+  options: { limit?: number; beforeTurn?: number } = {}
+): Promise<ConversationWithMessages> {
+  const params = new URLSearchParams();
+  if (options.limit) params.set('limit', String(options.limit));
+  if (options.beforeTurn != null) params.set('before_turn', String(options.beforeTurn));
+  const query = params.toString();
+  return hydrateMessages(await get(`/api/conversations/${conversationId}${query ? `?${query}` : ''}`));
+}
+
+// Only the messages after sinceTurn, plus the conversation's current fields and participants
+export async function getConversationChanges(conversationId: number, sinceTurn: number): Promise<ConversationChanges> {
+  return hydrateMessages(await get(`/api/conversations/${conversationId}/changes?since_turn=${sinceTurn}`));
+}
+
+// WebSocket URL for a conversation's live events; the token goes in the first frame (see conversationSocketAuth)
+export function getConversationSocketUrl(conversationId: number): string {
+  const base = API_BASE_URL.replace(/^http/, 'ws');
+  return `${base}/api/conversations/${conversationId}/ws`;
+}
+
+// First frame of a conversation socket: browsers can't set headers on sockets, and URLs end up in logs
+export async function conversationSocketAuth(): Promise<string> {
+  const { data: { session } } = await supabase.auth.getSession();
+  return JSON.stringify({ token: session?.access_token ?? '' });
+}
+
+function hydrateMessages<T extends { messages: Message[]; participants: Character[]; former_participants?: Character[] }>(
+  conversation: T
+): T {
+  const characters = new Map<number, Character>();
+  for (const character of [...(conversation.participants || []), ...(conversation.former_participants || [])]) {
+    characters.set(character.id, character);
+  }
+  conversation.messages = (conversation.messages || []).map((message: Message) => ({
+    ...message,
+    character: message.character_id != null ? characters.get(message.character_id) : undefined,
+  }));
+  return conversation;
+}
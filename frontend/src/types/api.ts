@@ -47,4 +47,21 @@ export interface Message {
 export interface ConversationWithMessages extends Conversation {
   messages: Message[];
   participants: Character[];
-}
\ No newline at end of file
+  former_participants?: Character[];
+  next_cursor?: number | null;
+}
+
+export interface ConversationChanges extends Conversation {
+  messages: Message[];
+  participants: Character[];
+  former_participants?: Character[];
+  last_turn: number;
+}
+
+// Pushed over /api/conversations/{id}/ws as changes are committed
+export type ConversationEvent =
+  | { event: 'message_created'; data: { message: Message } }
+  | { event: 'turn_advanced'; data: { current_turn: number } }
+  | { event: 'title_changed'; data: { title: string } }
+  | { event: 'resync'; data: Record<string, never> }
+  | { event: 'ready'; data: Record<string, never> };